@@ -0,0 +1,813 @@
+import argparse
+import glob
+import json
+import os.path
+import random
+import tempfile
+import threading
+import timeit
+import tracemalloc
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageChops, ImageDraw, ImageOps
+from rapidfuzz import process
+from rapidfuzz.utils import default_process
+
+import capture
+import database
+import ocr
+import recognition
+import status_classifier
+import submit_to_gc
+import tracing
+from matcher import TitleMatcher
+from inputs import InputController
+from ocr_cache import set_cache
+from recognition import improve_achievement_text, recognize_achievement, recognize_category
+from scroll_tracking import ScrollTracker, visible_rows
+from session import SessionArchive, SessionRecorder
+from utils import RECT, bold_color_mask, get_asset_path, scale_box_to_resolution
+from waits import wait_for_stable_frame
+
+# (size at 1440p, background, text color) - roughly what improve_* functions get from the game
+crop_styles = {
+    "title": ((941, 178), (240, 233, 220), (85, 85, 85)),
+    "status": ((220, 140), (240, 233, 220), (187, 167, 145)),
+    "category": ((697, 109), (233, 229, 220), (73, 83, 102)),
+}
+
+
+def reference_bold_color_mask(image: Image.Image, target_color=(85, 85, 85), threshold=50):
+    # Original per-pixel implementation, kept to check that the vectorized one produces the same output
+    mask = Image.new("L", image.size)
+    for x in range(image.width):
+        for y in range(image.height):
+            pixel = image.getpixel((x, y))
+            color_difference = sum((a - b) ** 2 for a, b in zip(pixel, target_color))
+            if color_difference <= threshold ** 2:
+                mask.putpixel((x, y), 0)
+            else:
+                mask.putpixel((x, y), 255)
+    return ImageChops.composite(Image.new("RGB", image.size, (255, 255, 255)), image, mask)
+
+
+ocr_confusions = [("l", "I"), ("I", "l"), ("rn", "m"), ("m", "rn"), ("O", "0"), ("e", "c"), ("'", ""), (",", "."),
+                  ("\"", "“"), ("é", "e"), (" ", "")]
+
+
+def load_database_names() -> tuple[list[str], list[str]]:
+    compiled = database.get_database()
+    return compiled.achievement_names, list(compiled.category_names.values())
+
+
+def load_names(count: int, seed: int = 0) -> list[str]:
+    return random.Random(seed).sample(load_database_names()[0], count)
+
+
+def add_ocr_noise(text: str, rng: random.Random) -> str:
+    # Clean reads, typical tesseract confusions, truncation and trailing junk
+    roll = rng.random()
+    if roll < 0.3:
+        return text
+    for _ in range(rng.randint(1, 3)):
+        wrong, right = rng.choice(ocr_confusions)
+        if wrong in text:
+            position = rng.choice([i for i in range(len(text)) if text.startswith(wrong, i)])
+            text = text[:position] + right + text[position + len(wrong):]
+    if roll > 0.9:
+        text = text[:max(3, int(len(text) * 0.8))]
+    elif roll > 0.8:
+        text += rng.choice([" |", " _", ".", " ©"])
+    return text
+
+
+def font_size(size: tuple) -> int:
+    return max(10, int(size[1] * 0.3))
+
+
+def wrap_header(name: str, size: tuple) -> str:
+    # Long category headers wrap onto a second line in game (Mondstadt, Liyue, Sumeru, Fontaine, Inazuma...).
+    # The game's font is wider than PIL's, about 70% of the box fits on one line in PIL's.
+    draw = ImageDraw.Draw(Image.new("RGB", size))
+    limit = size[0] * 0.7
+    words = name.split(" ")
+    for split in range(len(words), 0, -1):
+        first_line = " ".join(words[:split])
+        if draw.textlength(first_line, font_size=font_size(size)) <= limit:
+            return first_line + "\n" + " ".join(words[split:]) if split < len(words) else name
+    return name
+
+
+def render_crop(text: str, style: str, scale: float = 1.0, seed: int = 0, size: tuple = None) -> Image.Image:
+    (width, height), background, color = crop_styles[style]
+    size = size or (int(width * scale), int(height * scale))
+    rng = random.Random(seed)
+
+    image = Image.new("RGB", size, background)
+    draw = ImageDraw.Draw(image)
+    # Gradient + noise, so the mask has something to threshold away
+    for x in range(0, size[0], 4):
+        shade = int(20 * x / size[0])
+        draw.line([(x, 0), (x, size[1])], fill=tuple(c - shade for c in background), width=4)
+    top = size[1] // 3 if "\n" not in text else size[1] // 8
+    draw.text((int(10 * scale), top), text, fill=color, font_size=font_size(size))
+    noise = Image.effect_noise(size, 12).convert("RGB")
+    return ImageChops.blend(image, noise, 0.05 + rng.random() * 0.05)
+
+
+def benchmark_bold_color_mask(args: argparse.Namespace):
+    crops = [(style, render_crop(name, style, seed=i))
+             for i, name in enumerate(load_names(args.count)) for style in crop_styles]
+
+    for style, crop in crops:
+        _, _, color = crop_styles[style]
+        expected = ImageOps.grayscale(reference_bold_color_mask(crop, target_color=color))
+        actual = bold_color_mask(crop, target_color=color, grayscale=True)
+        if ImageChops.difference(expected, actual).getbbox() is not None:
+            raise AssertionError(f"bold_color_mask output differs from reference on a {style} crop")
+        if ImageChops.difference(reference_bold_color_mask(crop, target_color=color),
+                                 bold_color_mask(crop, target_color=color)).getbbox() is not None:
+            raise AssertionError(f"bold_color_mask (RGB) output differs from reference on a {style} crop")
+    print(f"bold_color_mask: output matches reference on {len(crops)} crops")
+
+    def run(func):
+        for style, crop in crops:
+            func(crop, target_color=crop_styles[style][2])
+
+    reference = min(timeit.repeat(lambda: run(reference_bold_color_mask), number=1, repeat=1))
+    vectorized = min(timeit.repeat(lambda: run(lambda crop, **kw: bold_color_mask(crop, grayscale=True, **kw)),
+                                   number=1, repeat=args.repeat))
+    print(f"bold_color_mask: reference {reference / len(crops) * 1000:.2f} ms/crop, "
+          f"vectorized {vectorized / len(crops) * 1000:.2f} ms/crop ({reference / vectorized:.0f}x)")
+
+
+def load_crops(crops_dir: str | None, count: int) -> list[Image.Image]:
+    # Saved crops (e.g. results/debug_images) if given, rendered and preprocessed title crops otherwise
+    if crops_dir:
+        paths = sorted(glob.glob(os.path.join(crops_dir, '*.png')))[:count]
+        return [Image.open(path).copy() for path in paths]
+    return [bold_color_mask(ImageOps.expand(render_crop(name, "title", seed=i), border=20, fill='#f0e9dc'),
+                            grayscale=True)
+            for i, name in enumerate(load_names(count))]
+
+
+def benchmark_ocr_engines(args: argparse.Namespace):
+    crops = load_crops(args.crops, args.count)
+    for name in ocr.engines:
+        try:
+            start = timeit.default_timer()
+            engine = ocr.create_engine(name)
+            startup = timeit.default_timer() - start
+        except Exception as exc:
+            print(f"ocr: {name} is not available ({exc})")
+            continue
+
+        best = min(timeit.repeat(lambda: [engine.recognize(crop) for crop in crops], number=1, repeat=args.repeat))
+        engine.close()
+        print(f"ocr: {name} startup {startup * 1000:.0f} ms, {best / len(crops) * 1000:.1f} ms/crop "
+              f"({len(crops) / best:.1f} crops/s)")
+
+
+def benchmark_matcher(args: argparse.Namespace):
+    achievements, categories = load_database_names()
+    rng = random.Random(0)
+    corpus = [add_ocr_noise(name, rng) for name in rng.choices(achievements, k=args.count * 50)]
+    merged = sorted(achievements + categories)
+
+    def linear(title: str) -> str:
+        # What fix_title_by_database did before TitleMatcher
+        result, confidence, _ = process.extractOne(title, merged, processor=default_process)
+        return result if confidence >= 90.0 else title
+
+    start = timeit.default_timer()
+    matcher = TitleMatcher(achievements, categories)
+    build = timeit.default_timer() - start
+
+    expected = [linear(title) for title in corpus]
+    actual = [matcher.match(title)[0] for title in corpus]
+    agreement = sum(a == b for a, b in zip(expected, actual)) / len(corpus)
+
+    linear_time = min(timeit.repeat(lambda: [linear(title) for title in corpus], number=1, repeat=args.repeat))
+    uncached_time = min(timeit.repeat(lambda: [TitleMatcher._match(matcher, title, matcher.indexes["achievement"])
+                                               for title in corpus], number=1, repeat=args.repeat))
+    cached_time = min(timeit.repeat(lambda: [matcher.match(title) for title in corpus], number=1, repeat=args.repeat))
+    print(f"matcher: {len(corpus)} noisy titles, index built in {build * 1000:.0f} ms, "
+          f"{agreement * 100:.1f}% same result as linear extractOne")
+    print(f"matcher: linear {linear_time / len(corpus) * 1e6:.0f} us/title, "
+          f"indexed {uncached_time / len(corpus) * 1e6:.0f} us/title, "
+          f"memoized {cached_time / len(corpus) * 1e6:.1f} us/title")
+
+    # Rows the way the scanner sees them: category by category, top to bottom, extra noisy. Also shuffled
+    # within every category, predictions must not turn into wrong titles when the list isn't in database order.
+    compiled = database.get_database()
+    scoped = TitleMatcher(achievements, categories, category_achievements={
+        category: compiled.category_achievement_names(category) for category in categories})
+    in_order = [(category, name, add_ocr_noise(add_ocr_noise(name, rng), rng))
+                for category in categories for name in compiled.category_achievement_names(category)]
+    shuffled = []
+    for category in categories:
+        category_rows = [row for row in in_order if row[0] == category]
+        rng.shuffle(category_rows)
+        shuffled += category_rows
+
+    def match_rows(rows: list[tuple], category_scoped: bool) -> list[tuple[str, float]]:
+        results, previous = [], None
+        for category, _, title in rows:
+            if category_scoped:
+                result, confidence = scoped._match(title, scoped.indexes["achievement"], category, previous)
+            else:
+                result, confidence = scoped._match(title, scoped.indexes["achievement"])
+            previous = result if confidence > 0 else None
+            results.append((result, confidence))
+        return results
+
+    for order, rows in (("in order", in_order), ("shuffled", shuffled)):
+        for category_scoped in (False, True):
+            scoped.stats.clear()
+            elapsed = min(timeit.repeat(lambda: match_rows(rows, category_scoped), number=1, repeat=args.repeat))
+            results = match_rows(rows, category_scoped)
+            correct = sum(result == name for (result, _), (_, name, _) in zip(results, rows))
+            # matched to another database title, these would be submitted as completed
+            wrong = sum(result != name and confidence > 0 for (result, confidence), (_, name, _) in zip(results, rows))
+            print(f"matcher: {'category-scoped' if category_scoped else 'global'} {len(rows)} rows {order}, "
+                  f"{elapsed / len(rows) * 1e6:.0f} us/title, {correct / len(rows) * 100:.1f}% correct, "
+                  f"{wrong} wrong titles, found by {dict(scoped.stats)}")
+
+
+class SyntheticFrames(object):
+    # Frame source on a fake clock: scrolls a rendered list for `animation` seconds, then stays still
+    def __init__(self, animation: float, frame_time: float = 1 / 60):
+        self.now = 0.0
+        self.animation = animation
+        self.frame_time = frame_time
+        self.page = render_crop("Overlooking View", "title")
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+    def grab(self) -> Image.Image:
+        self.now += self.frame_time  # capturing isn't free either
+        offset = int(min(self.now, self.animation) / self.animation * 167)
+        return ImageChops.offset(self.page, 0, -offset)
+
+
+def benchmark_waits(args: argparse.Namespace):
+    # (wait, animation length, fixed sleep it replaces)
+    cases = [("scroll", 0.25, 1.0), ("category click", 0.15, 0.5), ("menu", 0.6, 2.0), ("still", 0.0, 0.5)]
+    for name, animation, fixed in cases:
+        frames = SyntheticFrames(max(animation, 1e-6))
+        elapsed = wait_for_stable_frame(frames.grab, timeout=fixed, clock=frames.clock, sleep=frames.sleep)
+        if elapsed < animation or elapsed >= fixed:
+            raise AssertionError(f"waits: {name} returned after {elapsed:.3f}s, animation takes {animation:.3f}s")
+        print(f"waits: {name} settled after {elapsed:.3f}s (animation {animation:.2f}s, fixed sleep {fixed:.1f}s)")
+
+
+def render_status(label: str, scale: float, seed: int) -> Image.Image:
+    # Stand-ins for the game's status boxes, step boxes are drawn as a step counter. The real step boxes
+    # only come from a recorded session with a labels file.
+    rng = random.Random(seed)
+    if label == "completed":
+        return render_crop("Completed", "status", scale, seed)
+    if label == "in_progress":
+        return render_crop(f"{rng.randint(0, 9)}/{rng.choice([5, 10, 20])}", "status", scale, seed)
+    return render_crop(f"Step {label.split('_')[1]}/3", "status", scale, seed)
+
+
+def load_statuses(session: str | None, labels: str | None, count: int) -> list[tuple[str, Image.Image]]:
+    # (label, raw status crop) from a recorded session or rendered at a few resolutions
+    if session:
+        return status_classifier.label_session(session, labels)
+    return [(label, render_status(label, scale, seed=i))
+            for i in range(count) for label in status_classifier.labels for scale in (1.0, 0.75, 0.625, 0.5)]
+
+
+def benchmark_status(args: argparse.Namespace):
+    # References from every other crop, the rest is classified. Wrong labels are the ones that matter,
+    # confident ones skip OCR; unsure ones fall back to it.
+    samples = load_statuses(args.session, args.labels, args.count)
+    classifier = status_classifier.StatusClassifier(status_classifier.build_references(samples[::2]))
+    held_out = samples[1::2]
+    elapsed = min(timeit.repeat(lambda: [classifier.classify(image) for _, image in held_out],
+                                number=1, repeat=args.repeat))
+
+    outcomes: dict[str, Counter] = {}
+    for label, image in held_out:
+        result, confidence = classifier.classify(image)
+        if result is None or confidence < classifier.min_confidence:
+            outcome = "ocr"
+        else:
+            outcome = "correct" if result == label else "wrong"
+        outcomes.setdefault(label, Counter())[outcome] += 1
+    for label, counts in outcomes.items():
+        total = sum(counts.values())
+        print(f"status: {label} {counts['correct']}/{total} correct, {counts['wrong']} wrong, "
+              f"{counts['ocr']} fall back to OCR")
+    fallbacks = sum(counts["ocr"] for counts in outcomes.values())
+    print(f"status: {len(held_out)} crops from {'session' if args.session else 'rendered boxes'}, "
+          f"{elapsed / len(held_out) * 1e6:.0f} us/crop, {fallbacks / len(held_out) * 100:.1f}% fall back to OCR")
+
+
+def load_pages(session: str | None, count: int) -> list[list[Image.Image]]:
+    # Preprocessed title crops, page by page, from a recorded session or rendered
+    if session:
+        archive = SessionArchive(session)
+        pages = [[improve_achievement_text(achievement["title"]) for achievement in page]
+                 for page, _ in zip(archive.pages(), range(count))]
+        archive.close()
+        return pages
+    names = load_names(count * 5)
+    return [[improve_achievement_text(render_crop(name, "title", seed=i)) for name in names[i * 5:i * 5 + 5]]
+            for i in range(count)]
+
+
+def benchmark_batch_ocr(args: argparse.Namespace):
+    pages = load_pages(args.session, args.count)
+    crops = sum(len(page) for page in pages)
+    try:
+        engine = ocr.create_engine()
+    except Exception as exc:
+        print(f"batch: no OCR engine available ({exc})")
+        return
+
+    single = min(timeit.repeat(lambda: [[engine.recognize(crop) for crop in page] for page in pages],
+                               number=1, repeat=args.repeat))
+    batched = min(timeit.repeat(lambda: [ocr.recognize_batch(page, engine) for page in pages],
+                                number=1, repeat=args.repeat))
+    results = [ocr.recognize_batch(page, engine) for page in pages]
+    fallbacks = sum(result is None for page in results for result in page)
+    agreement = sum((batch or "").strip().splitlines()[:1] == engine.recognize(crop).strip().splitlines()[:1]
+                    for page, page_results in zip(pages, results)
+                    for crop, batch in zip(page, page_results) if batch is not None) / max(1, crops - fallbacks)
+    engine.close()
+    print(f"batch: {engine.name} per-crop {crops / single:.1f} crops/s, batched {crops / batched:.1f} crops/s "
+          f"({single / batched:.1f}x), {fallbacks}/{crops} crops need per-crop fallback, "
+          f"{agreement * 100:.1f}% same first line")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Local stand-in for genshin-center.com: records request times, throttles or fails some requests once
+    requests: list[float] = []
+    attempts: dict[int, int] = {}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        achievement_id = body['achievementId']
+        with self.lock:
+            self.requests.append(timeit.default_timer())
+            attempt = self.attempts[achievement_id] = self.attempts.get(achievement_id, 0) + 1
+        status = 200
+        if attempt == 1 and achievement_id % 10 == 0:
+            status = 429
+        elif attempt == 1 and achievement_id % 15 == 0:
+            status = 503
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def benchmark_submit(args: argparse.Namespace):
+    rate = 20.0
+    ids = list(range(1, args.count * 10 + 1))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/achievements/update"
+
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = submit_to_gc.Ledger(os.path.join(directory, 'ledger.json'))
+        start = timeit.default_timer()
+        failed = submit_to_gc.submit_ids(ids, "session=benchmark", ledger, rate=rate, url=url)
+        elapsed = timeit.default_timer() - start
+        resent = submit_to_gc.submit_ids(ids, "session=benchmark", submit_to_gc.Ledger(ledger.path),
+                                         rate=rate, url=url)
+    server.shutdown()
+
+    times = sorted(StandInHandler.requests)
+    busiest = max(sum(1 for t in times if start_time <= t < start_time + 1) for start_time in times)
+    print(f"submit: {len(ids)} ids in {elapsed:.2f}s ({len(ids) / elapsed:.1f} ids/s), {len(times)} requests, "
+          f"{len(failed)} failed, busiest second {busiest} requests (cap {rate:.0f}/s)")
+    if failed or resent or busiest > rate + 1:
+        raise AssertionError(f"submit: failed {failed}, re-run failed {resent}, busiest second {busiest}")
+    if len(times) != len(ids) + sum(1 for i in ids if i % 10 == 0 or i % 15 == 0):
+        raise AssertionError(f"submit: ledger re-run sent {len(times)} requests")
+
+
+def benchmark_database(args: argparse.Namespace):
+    # Startup cost: parsing and indexing the JSON assets vs loading the compiled blob
+    with tempfile.TemporaryDirectory() as directory:
+        assets = dict(get_asset_path(), **{'gc_database.pickle': os.path.join(directory, 'gc_database.pickle')})
+        compiled = database.build(assets)
+        json_time = min(timeit.repeat(lambda: database.Database.from_json(assets), number=1, repeat=args.repeat))
+        pickle_time = min(timeit.repeat(lambda: database.load(assets), number=1, repeat=args.repeat))
+        loaded = database.load(assets)
+        size = os.path.getsize(assets['gc_database.pickle'])
+    if vars(loaded) != vars(compiled):
+        raise AssertionError("database: compiled blob differs from the JSON assets")
+    print(f"database: {len(compiled.name_by_id)} achievements, JSON {json_time * 1000:.1f} ms, "
+          f"compiled {pickle_time * 1000:.1f} ms ({size / 1024:.0f} KiB)")
+
+
+def benchmark_session(args: argparse.Namespace):
+    # Time record() takes on the capture path, with the writer thread vs writing in place
+    crops = [render_crop(name, style, seed=i)
+             for i, name in enumerate(load_names(args.count)) for style in crop_styles]
+    rows = [(crop, i // len(crop_styles)) for i, crop in enumerate(crops * 10)]
+    with tempfile.TemporaryDirectory() as directory:
+        for compresslevel in (1, 0):
+            path = os.path.join(directory, f'session_{compresslevel}.zip')
+            recorder = SessionRecorder(path, compresslevel=compresslevel, max_queue=len(rows))
+            start = timeit.default_timer()
+            for crop, achievement_id in rows:
+                recorder.record(crop, "title", "row_0", achievement_id, 1)
+            hot_path = timeit.default_timer() - start
+            recorder.close()
+            total = timeit.default_timer() - start
+
+            # what record() used to cost on the capture path, when it compressed in place
+            in_place = min(timeit.repeat(lambda: [zlib.compress(crop.tobytes(), compresslevel) if compresslevel
+                                                  else crop.tobytes() for crop, _ in rows], number=1, repeat=1))
+
+            archive = SessionArchive(path)
+            first = archive.image(archive.entries[0])
+            archive.close()
+            if len(archive.entries) != len(rows) or first.tobytes() != rows[0][0].tobytes():
+                raise AssertionError(f"session: archive has {len(archive.entries)} of {len(rows)} crops")
+            print(f"session: compresslevel {compresslevel}, record() {hot_path / len(rows) * 1e6:.0f} us/crop "
+                  f"(in place {in_place / len(rows) * 1e6:.0f} us/crop), all written after {total:.2f}s, "
+                  f"{os.path.getsize(path) / 2 ** 20:.1f} MB")
+
+        recorder = SessionRecorder(os.path.join(directory, 'failures.zip'), policy="failures")
+        for i, (crop, achievement_id) in enumerate(rows):
+            recorder.record(crop, "title", "row_0", achievement_id, 1)
+            if i >= 30:  # results come back a couple of pages behind the captures
+                lagging_id = rows[i - 30][1]
+                recorder.resolve(lagging_id, "" if lagging_id % 4 == 0 else "Overlooking View", 100.0)
+        recorder.close()
+        print(f"session: failures policy kept {recorder.stats()}")
+
+
+def render_list(names: list[str], pitch: int, height: int, scale: float) -> Image.Image:
+    # A whole achievement list as one tall image, base pixels scaled by `scale`
+    (width, _), background, color = crop_styles["title"]
+    image = Image.new("RGB", (int(width * scale), int((len(names) * pitch + height) * scale)), background)
+    draw = ImageDraw.Draw(image)
+    for row, name in enumerate(names):
+        top = int(row * pitch * scale)
+        draw.rectangle((0, top, image.width, top + int((pitch - 20) * scale)), fill=(225, 218, 205))
+        draw.text((int(10 * scale), top + int(40 * scale)), name, fill=color, font_size=max(10, int(40 * scale)))
+    return image
+
+
+def scan_list(tracker: ScrollTracker, scroll, pitch: int, row_height: int, view_height: int) -> list[int]:
+    # The scanner's walk down a list: reads the rows not seen yet, scrolls with `scroll(steps)` -> how far the
+    # tracker says the list moved, stops once it doesn't
+    scanned, next_row = [], 0
+    while True:
+        rows = [row for row, _ in visible_rows(0, pitch, row_height, 0, view_height, tracker.position)
+                if row >= next_row]
+        scanned += rows
+        if len(rows) > 0:
+            next_row = rows[-1] + 1
+        if scroll(tracker.steps_for(view_height - 2 * pitch)) < 1:
+            return scanned
+
+
+def benchmark_scroll(args: argparse.Namespace):
+    # Scans a rendered list with the scroll tracker, the wheel scrolls a bit less than the tracker assumes
+    pitch, row_height, view_height, scale, true_notch = 167, 138, 1122, 0.5, 23.3
+    names = load_names(args.count * 10)
+    content = render_list(names, pitch, view_height, scale)
+    end = len(names) * pitch - view_height + 20  # list can't scroll further than this
+    position, wheel_events, registrations, registration = 0.0, 0, 0, 0.0
+
+    def grab() -> Image.Image:
+        top = int(position * scale)
+        return content.crop((0, top, content.width, top + int(view_height * scale)))
+
+    def scroll(steps: int) -> float:
+        nonlocal position, wheel_events, registrations, registration
+        wheel_events += steps
+        position = min(end, position + steps * true_notch)
+        start = timeit.default_timer()
+        moved = tracker.update(grab(), steps)
+        registration += timeit.default_timer() - start
+        registrations += 1
+        return moved
+
+    tracker = ScrollTracker(835 / 35, scale)
+    tracker.reset(grab())
+    scanned = scan_list(tracker, scroll, pitch, row_height, view_height)
+
+    expected = [row for row in range(len(names)) if row * pitch + row_height <= end + view_height]
+    if scanned != expected:
+        raise AssertionError(f"scroll: scanned rows {scanned}, expected {expected}")
+    if abs(tracker.position - position) > 2:
+        raise AssertionError(f"scroll: tracker is at {tracker.position:.1f}, list at {position:.1f}")
+    print(f"scroll: {len(scanned)} rows scanned once each, {wheel_events} wheel notches in {registrations} scrolls, "
+          f"notch estimate {tracker.notch:.2f} (actual {true_notch}), "
+          f"{registration * 1000 / registrations:.1f} ms per registration")
+
+
+def capture_pages(backend: capture.CaptureBackend, boxes: list[RECT], wait_box: RECT, pages: int) -> list:
+    # What the scanner asks for per page: a few wait_for_ui polls, one window frame, every row cropped from it
+    crops = []
+    for _ in range(pages):
+        for _ in range(3):
+            backend.grab(wait_box)
+        frame = backend.grab_array()
+        left, top = int(backend.window_rect.left), int(backend.window_rect.top)
+        crops = [Image.fromarray(frame[int(box.top) - top:int(box.bottom) - top,
+                                       int(box.left) - left:int(box.right) - left]) for box in boxes]
+    return crops
+
+
+def benchmark_capture(args: argparse.Namespace):
+    # Capture throughput of every backend that works here, rendered window screenshots through FileCapture
+    window_rect = RECT(0, 0, 1920, 1080)
+    scale = window_rect.height() / 1440
+    boxes = [scale_box_to_resolution(RECT(left, 176 + row * 167, width, 138), window_rect)
+             for row in range(6) for left, width in ((1167, 878), (2208, 220))]
+    wait_box = scale_box_to_resolution(RECT(1200, 200, 400, 250), window_rect)
+    with tempfile.TemporaryDirectory() as directory:
+        names = load_names(args.count * 6)
+        content = render_list(names, 167, 1122, scale)
+        for i in range(args.count):
+            frame = Image.new("RGB", (window_rect.width(), window_rect.height()), (40, 40, 50))
+            frame.paste(content.crop((0, int(i * 167 * 6 * scale), content.width,
+                                      int((i * 167 * 6 + 1122) * scale))), (int(1167 * scale), int(170 * scale)))
+            frame.save(os.path.join(directory, f'frame_{i:03}.png'))
+
+        sources = {"file (screenshots)": lambda: capture.FileCapture(window_rect, directory),
+                   "mss": lambda: capture.MssCapture(window_rect)}
+        for name, create in sources.items():
+            try:
+                backend = create()
+            except Exception as exc:
+                print(f"capture: {name} is not available ({exc})")
+                continue
+            start = timeit.default_timer()
+            crops = capture_pages(backend, boxes, wait_box, args.count * 10)
+            elapsed = timeit.default_timer() - start
+            if name == "file (screenshots)":
+                expected = backend.images[backend.position].crop((boxes[0].left, boxes[0].top,
+                                                                  boxes[0].right, boxes[0].bottom))
+                if crops[0].tobytes() != expected.tobytes():
+                    raise AssertionError("capture: crop from the window frame doesn't match the screenshot")
+            backend.close()
+            print(f"capture: {name}, {args.count * 10 / elapsed:.1f} pages/s, {backend.stats()}")
+
+
+class FakeGameWindow(object):
+    # Stands in for the pywinauto window: a list that scrolls `notch` base pixels per wheel notch. Games that
+    # don't honour multi-notch deltas scroll one notch per wheel event whatever the delta.
+    def __init__(self, notch: float, end: float, honours_delta: bool):
+        self.notch = notch
+        self.end = end
+        self.honours_delta = honours_delta
+        self.position = 0.0
+        self.events = Counter()
+
+    def wheel_mouse_input(self, coords: tuple, wheel_dist: int):
+        self.events["wheel"] += 1
+        notches = 1 if wheel_dist == InputController.paced_wheel_dist or not self.honours_delta else -wheel_dist
+        self.position = min(self.end, self.position + notches * self.notch)
+
+    def click_input(self, button: str, coords: tuple):
+        self.events["click"] += 1
+
+
+def benchmark_inputs(args: argparse.Namespace):
+    # Input events per achievement of a scan with the rows read from page snapshots. Genshin reads one notch per
+    # wheel event, that's the default paced input; batched wheel input is opt-in, shown falling back on such a
+    # game and on a hypothetical one that takes multi-notch deltas
+    pitch, row_height, view_height, scale, true_notch = 167, 138, 1122, 0.5, 23.3
+    names = load_names(args.count * 10)
+    content = render_list(names, pitch, view_height, scale)
+    end = len(names) * pitch - view_height + 20
+    for honours_delta, batch_wheel in ((False, False), (False, True), (True, True)):
+        window = FakeGameWindow(true_notch, end, honours_delta)
+        controller = InputController(window, batch_wheel)
+        controller.wheel_pacing = 0.0  # counted below instead of slept through
+
+        def grab() -> Image.Image:
+            top = int(window.position * scale)
+            return content.crop((0, top, content.width, top + int(view_height * scale)))
+
+        def scroll(steps: int) -> float:
+            nonlocal scrolls, paced_notches
+            paced_notches += steps
+            scrolls += 1
+            controller.scroll(steps, (0, 0))
+            moved = tracker.update(grab(), steps)
+            if controller.wheel_moved_one_notch(steps, moved / tracker.notch):
+                controller.scroll(steps - 1, (0, 0))
+                moved += tracker.update(grab(), steps - 1)
+            return moved
+
+        tracker = ScrollTracker(835 / 35, scale)
+        tracker.reset(grab())
+        scrolls, paced_notches = 0, 0
+        scanned = scan_list(tracker, scroll, pitch, row_height, view_height)
+
+        if len(scanned) != len(set(scanned)) or abs(tracker.position - window.position) > 2:
+            raise AssertionError(f"inputs: scan went wrong, rows {scanned}, tracker at {tracker.position:.1f}, "
+                                 f"list at {window.position:.1f}")
+        # what the same scan cost before: a click on title and status of every row, a paced event per notch
+        before = 2 * len(scanned) + paced_notches
+        pacing = (window.events["wheel"] - scrolls) * InputController.wheel_pacing
+        print(f"inputs: {'batched' if batch_wheel else 'paced'} wheel input on a "
+              f"{'multi-notch' if honours_delta else 'one notch per event'} game, "
+              f"{len(scanned)} rows, {sum(window.events.values())} input events "
+              f"({sum(window.events.values()) / len(scanned):.2f}/achievement, was {before / len(scanned):.2f}), "
+              f"{pacing:.2f}s of wheel pacing (was {paced_notches * InputController.wheel_pacing:.2f}s), "
+              f"ended up {controller.stats(len(scanned))['wheel']}")
+
+
+resolutions = [(2560, 1440), (1920, 1080), (1600, 900), (1280, 720)]
+
+
+def crop_size(style: str, resolution: tuple) -> tuple:
+    # Same scaling the scanner applies to its boxes
+    (width, height), _, _ = crop_styles[style]
+    box = scale_box_to_resolution(RECT(0, 0, width, height), RECT(0, 0, *resolution))
+    return box.width(), box.height()
+
+
+def build_corpus(samples: int, seed: int = 0) -> list[dict]:
+    # Labeled rows (title + status crop) and category crops, rendered from database names at every resolution.
+    # Every other block of 20 samples only has headers that wrap onto a second line.
+    achievements, categories = load_database_names()
+    wrapped = [name for name in categories if "\n" in wrap_header(name, crop_styles["category"][0])]
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(samples):
+        resolution = resolutions[i % len(resolutions)]
+        if i % 5 == 4:
+            name = rng.choice(wrapped if (i // 20) % 2 == 1 else categories)
+            size = crop_size("category", resolution)
+            header = wrap_header(name, size)
+            corpus.append({"kind": "category", "resolution": resolution, "label": name, "wrapped": "\n" in header,
+                           "image": render_crop(header, "category", seed=i, size=size)})
+            continue
+        name, completed = rng.choice(achievements), rng.random() < 0.6
+        status_text = "Completed" if completed else f"{rng.randint(0, 9)}/10"
+        corpus.append({"kind": "achievement", "resolution": resolution, "label": (name, completed),
+                       "image": render_crop(name, "title", seed=i, size=crop_size("title", resolution)),
+                       "status": render_crop(status_text, "status", seed=i, size=crop_size("status", resolution))})
+    return corpus
+
+
+def recognize_sample(sample: dict):
+    if sample["kind"] == "category":
+        return recognize_category(sample["image"])
+    return recognize_achievement(sample["image"], sample["status"])
+
+
+def compare_to_baseline(results: dict, baseline: dict) -> list[str]:
+    regressions = []
+    if results["crops_per_second"] < baseline["crops_per_second"] * 0.9:
+        regressions.append(f"throughput {results['crops_per_second']:.1f} crops/s, "
+                           f"baseline {baseline['crops_per_second']:.1f}")
+    if results["peak_memory_mb"] > baseline["peak_memory_mb"] * 1.2:
+        regressions.append(f"peak memory {results['peak_memory_mb']:.1f} MB, "
+                           f"baseline {baseline['peak_memory_mb']:.1f}")
+    for metric, accuracy in results["accuracy"].items():
+        if accuracy < baseline["accuracy"].get(metric, 0.0) - 0.01:
+            regressions.append(f"{metric} accuracy {accuracy * 100:.1f}%, "
+                               f"baseline {baseline['accuracy'][metric] * 100:.1f}%")
+    return regressions
+
+
+def score_corpus(corpus: list[dict], recognized: list) -> dict[str, float]:
+    correct: dict[str, list[bool]] = {}
+    for sample, result in zip(corpus, recognized):
+        resolution = "x".join(map(str, sample["resolution"]))
+        if sample["kind"] == "category":
+            checks = {"category": result == sample["label"]}
+            if sample["wrapped"]:
+                checks["wrapped category"] = checks["category"]
+        else:
+            checks = {"title": result[0] == sample["label"][0], "status": result[1] == sample["label"][1]}
+        for metric, ok in checks.items():
+            correct.setdefault(metric, []).append(ok)
+            correct.setdefault(f"{metric}@{resolution}", []).append(ok)
+    return {metric: sum(oks) / len(oks) for metric, oks in sorted(correct.items())}
+
+
+def benchmark_accuracy(args: argparse.Namespace):
+    # End-to-end speed and accuracy of improve_* -> OCR -> fix_title_by_database over a labeled corpus
+    try:
+        engine = ocr.get_engine()
+    except Exception as exc:
+        print(f"accuracy: no OCR engine available ({exc})")
+        return
+    set_cache(None)  # every crop has to go through OCR
+    corpus = build_corpus(args.samples)
+    crops = sum(2 if sample["kind"] == "achievement" else 1 for sample in corpus)
+    recognize_sample(corpus[0])  # database, matcher and OCR profiles are loaded once per scan, not timed
+
+    # same corpus without the region-specific OCR profiles, for comparison
+    recognition.use_profiles = False
+    start = timeit.default_timer()
+    try:
+        unprofiled = [recognize_sample(sample) for sample in corpus]
+    finally:
+        recognition.use_profiles = True
+    unprofiled_elapsed = timeit.default_timer() - start
+    unprofiled_accuracy = score_corpus(corpus, unprofiled)
+
+    tracer = tracing.Tracer()
+    tracing.set_tracer(tracer)
+    start = timeit.default_timer()
+    try:
+        recognized = [recognize_sample(sample) for sample in corpus]
+    finally:
+        tracing.set_tracer(None)
+    elapsed = timeit.default_timer() - start
+
+    tracemalloc.start()  # slows everything down, so peak memory gets a separate, shorter pass
+    for sample in corpus[:20]:
+        recognize_sample(sample)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results = {"engine": engine.name, "samples": len(corpus), "crops_per_second": crops / elapsed,
+               "peak_memory_mb": peak / 2 ** 20, "accuracy": score_corpus(corpus, recognized),
+               "unprofiled": {"crops_per_second": crops / unprofiled_elapsed, "accuracy": unprofiled_accuracy},
+               "stages": tracer.stats()}
+    print(f"accuracy: {engine.name}, {len(corpus)} samples, {crops} crops in {elapsed:.2f}s "
+          f"({results['crops_per_second']:.1f} crops/s), peak memory {results['peak_memory_mb']:.1f} MB")
+    print("accuracy: " + ", ".join(f"{metric} {accuracy * 100:.1f}%"
+                                   for metric, accuracy in results["accuracy"].items() if "@" not in metric))
+    for resolution in resolutions:
+        suffix = "@" + "x".join(map(str, resolution))
+        print(f"accuracy: {suffix[1:]:>9} " + ", ".join(f"{metric[:-len(suffix)]} {accuracy * 100:.1f}%"
+                                                        for metric, accuracy in results["accuracy"].items()
+                                                        if metric.endswith(suffix)))
+    print(f"accuracy: without OCR profiles {results['unprofiled']['crops_per_second']:.1f} crops/s, "
+          + ", ".join(f"{metric} {accuracy * 100:.1f}%"
+                      for metric, accuracy in unprofiled_accuracy.items() if "@" not in metric))
+    print(tracer.summary())
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+        print(f"accuracy: saved baseline to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"accuracy: no baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    if baseline["engine"] != engine.name or baseline["samples"] != len(corpus):
+        print(f"accuracy: baseline is for {baseline['engine']} / {baseline['samples']} samples, not comparing")
+        return
+    regressions = compare_to_baseline(results, baseline)
+    if regressions:
+        raise AssertionError("accuracy: regressed against baseline: " + "; ".join(regressions))
+    print(f"accuracy: no regressions against {args.baseline}")
+
+
+benchmarks = {
+    "mask": benchmark_bold_color_mask,
+    "ocr": benchmark_ocr_engines,
+    "matcher": benchmark_matcher,
+    "waits": benchmark_waits,
+    "status": benchmark_status,
+    "batch": benchmark_batch_ocr,
+    "submit": benchmark_submit,
+    "database": benchmark_database,
+    "accuracy": benchmark_accuracy,
+    "session": benchmark_session,
+    "scroll": benchmark_scroll,
+    "capture": benchmark_capture,
+    "inputs": benchmark_inputs,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmarks, runnable without the game")
+    parser.add_argument("benchmark", choices=list(benchmarks.keys()) + ["all"], nargs="?", default="all")
+    parser.add_argument("--count", type=int, default=10, help="Number of sample crops per style")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--crops", help="Directory with saved *.png crops to use instead of rendered ones")
+    parser.add_argument("--session", help="Recorded session archive to take pages from instead of rendering them")
+    parser.add_argument("--labels", help="Status labels for --session, see status_classifier.py")
+    parser.add_argument("--samples", type=int, default=300, help="Size of the labeled corpus for accuracy")
+    parser.add_argument("--baseline", default=os.path.join('results', 'benchmark_baseline.json'),
+                        help="Accuracy results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Save accuracy results as the new baseline")
+    args = parser.parse_args()
+
+    for name, benchmark in benchmarks.items():
+        if args.benchmark in (name, "all"):
+            benchmark(args)
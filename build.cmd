@@ -1,2 +1,3 @@
+python database.py
 pyinstaller main.spec
 pyinstaller submit_to_gc.spec
\ No newline at end of file
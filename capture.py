@@ -0,0 +1,153 @@
+import glob
+import logging
+import os.path
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils import RECT
+
+try:
+    import mss
+except ImportError:  # optional, falls back to pywinauto's capture_as_image
+    mss = None
+
+# Where the scanner's pixels come from. Every backend grabs screen rects (None - the whole window) and counts
+# frames, bytes copied and time spent, so capture throughput can be compared between them.
+logger = logging.getLogger("Capture")
+
+
+class CaptureBackend(object):
+    name: str = "base"
+
+    def __init__(self, window_rect: RECT):
+        self.window_rect = window_rect
+        self.frames = 0
+        self.bytes_copied = 0
+        self.seconds = 0.0
+
+    def _grab(self, rect: RECT) -> Image.Image:
+        raise NotImplementedError
+
+    def grab(self, rect: RECT = None) -> Image.Image:
+        # Owned image of a screen rect, safe to keep around
+        start = time.perf_counter()
+        image = self._grab(rect or self.window_rect)
+        self.count(start, image.width * image.height * len(image.getbands()))
+        return image
+
+    def grab_array(self, rect: RECT = None) -> np.ndarray:
+        # (height, width, 3) RGB pixels, backends that can avoid copies return a view of a reused buffer
+        # that is only valid until the next grab_array() of the same size
+        return np.asarray(self.grab(rect))
+
+    def count(self, start: float, copied: int):
+        self.frames += 1
+        self.bytes_copied += copied
+        self.seconds += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "frames": self.frames, "mb_copied": round(self.bytes_copied / 2 ** 20, 1),
+                "frames_per_second": round(self.frames / self.seconds, 1) if self.seconds > 0 else 0.0}
+
+    def close(self):
+        pass
+
+
+class WindowCapture(CaptureBackend):
+    # pywinauto's capture_as_image: GDI into a new PIL image on every call
+    name = "window"
+
+    def __init__(self, window_rect: RECT, window):
+        super().__init__(window_rect)
+        self.window = window
+
+    def _grab(self, rect: RECT) -> Image.Image:
+        return self.window.capture_as_image(rect=rect)
+
+
+class MssCapture(CaptureBackend):
+    # mss screen grabs, whole-window frames are converted from BGRA into preallocated RGB buffers
+    name = "mss"
+
+    def __init__(self, window_rect: RECT, window=None):
+        super().__init__(window_rect)
+        if mss is None:
+            raise Exception("mss is not installed")
+        self.screen = mss.mss()
+        self.buffers: Dict[Tuple[int, int], np.ndarray] = {}  # (height, width) - RGB buffer
+
+    def shot(self, rect: RECT):
+        return self.screen.grab({"left": int(rect.left), "top": int(rect.top),
+                                 "width": int(rect.width()), "height": int(rect.height())})
+
+    def _grab(self, rect: RECT) -> Image.Image:
+        shot = self.shot(rect)
+        return Image.frombuffer("RGB", shot.size, shot.raw, "raw", "BGRX", 0, 1)
+
+    def grab_array(self, rect: RECT = None) -> np.ndarray:
+        start = time.perf_counter()
+        shot = self.shot(rect or self.window_rect)
+        buffer = self.buffers.get((shot.height, shot.width))
+        if buffer is None:
+            buffer = self.buffers[(shot.height, shot.width)] = np.empty((shot.height, shot.width, 3), np.uint8)
+        np.copyto(buffer, np.frombuffer(shot.raw, np.uint8).reshape(shot.height, shot.width, 4)[..., 2::-1])
+        self.count(start, buffer.nbytes)
+        return buffer
+
+    def close(self):
+        self.screen.close()
+
+
+class FileCapture(CaptureBackend):
+    # Stand-in without a game window: frames from a directory of window screenshots (*.png, window-sized).
+    # Whole-window grabs move to the next one, looping around, rects are cropped from the current one.
+    # Session archives only have the title/status/category crops, not the wait regions and list snapshots the
+    # scanner also asks for, so they can't stand in for a window - replay.py re-runs those instead.
+    name = "file"
+
+    def __init__(self, window_rect: RECT, path: str):
+        super().__init__(window_rect)
+        self.path = path
+        if not os.path.isdir(path):
+            raise Exception(f"{path} is not a directory of window screenshots")
+        self.images: List[Image.Image] = [Image.open(image_path).convert("RGB")
+                                          for image_path in sorted(glob.glob(os.path.join(path, "*.png")))]
+        if len(self.images) == 0:
+            raise Exception(f"No frames in {path}")
+        self.position = -1
+
+    def next_image(self) -> Image.Image:
+        self.position = (self.position + 1) % len(self.images)
+        return self.images[self.position]
+
+    def _grab(self, rect: RECT) -> Image.Image:
+        frame = self.next_image() if rect is self.window_rect or self.position < 0 else self.images[self.position]
+        left, top = int(self.window_rect.left), int(self.window_rect.top)
+        return frame.crop((int(rect.left) - left, int(rect.top) - top, int(rect.right) - left, int(rect.bottom) - top))
+
+
+backends = {
+    MssCapture.name: MssCapture,
+    WindowCapture.name: WindowCapture,
+}
+
+
+def create_backend(window_rect: RECT, window=None, name: str = None) -> CaptureBackend:
+    # `name` - one of backends or a screenshot directory for FileCapture, None - the fastest one available
+    if name is not None and name not in backends:
+        if not os.path.isdir(name):
+            raise Exception(f"Unknown capture backend {name}, expected one of {', '.join(backends)} "
+                            "or a directory of window screenshots")
+        return FileCapture(window_rect, name)
+    if name is not None:
+        return backends[name](window_rect, window)
+
+    for backend in backends.values():
+        try:
+            return backend(window_rect, window)
+        except Exception as exc:
+            logger.debug(f"Capture backend {backend.name} is not available: {exc}")
+    raise Exception("No capture backend available")
@@ -0,0 +1,97 @@
+import json
+import logging
+import os.path
+from typing import Dict, Set
+
+from database import get_database
+from status_classifier import is_completed
+
+logger = logging.getLogger("Checkpoint")
+
+
+class CheckpointLog(object):
+    # Append-only JSON lines, one per scanned achievement and one per finished category, flushed as they come
+    # so a crashed scan can be resumed from where it stopped.
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.finished: Dict[int, dict] = {}  # category_id - {"name": ..., "achievement_id": ...}
+        self.achievements: Dict[str, bool | int] = {}  # completed ones, same as AchievementScanner.achievements
+        cut_off = False
+        if resume and os.path.exists(path):
+            self.load()
+            if os.path.getsize(path) > 0:
+                with open(path, 'rb') as file:
+                    file.seek(-1, os.SEEK_END)
+                    cut_off = file.read(1) != b'\n'
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if cut_off:
+            self.file.write("\n")  # don't glue the next record to a broken line
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # last line of a crashed scan might be cut off
+                    logger.warning(f"Skipping broken checkpoint line: {line!r}")
+                    continue
+                if record["type"] == "achievement" and record["completed"]:
+                    self.achievements[record["title"]] = record["completed"]
+                elif record["type"] == "category":
+                    self.finished[record["category_id"]] = record
+        logger.info(f"Resuming after {len(self.finished)} categories, {len(self.achievements)} completed achievements")
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def achievement(self, category: str, title: str, completed: bool | int):
+        self.write({"type": "achievement", "category": category, "title": title, "completed": completed})
+
+    def category_done(self, category_id: int, name: str, achievement_id: int):
+        record = {"type": "category", "category_id": category_id, "name": name, "achievement_id": achievement_id}
+        self.finished[category_id] = record
+        self.write(record)
+
+    def close(self):
+        self.file.close()
+
+
+def load_category_names() -> Dict[str, Set[str]]:
+    database = get_database()
+    names = {name: set() for name in database.category_names.values()}
+    for category_id, achievement_ids in database.ids_by_category.items():
+        category = database.category_names.get(category_id)
+        if category is not None:
+            names[category].update(database.name_by_id[i] for i in achievement_ids)
+    return names
+
+
+def completion_state(completed: bool | int | None) -> tuple:
+    # Comparable result: 1 == True, but one finished step isn't the same as completed
+    if is_completed(completed):
+        return bool, True
+    return type(completed), completed
+
+
+class PreviousScan(object):
+    # Result of the last scan, for incremental scans: completed achievements never go back to incomplete,
+    # so categories completed back then don't need to be scanned again, and neither does the rest of a list
+    # once everything not seen yet was completed back then.
+
+    def __init__(self, path: str):
+        self.completed: Dict[str, bool | int] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.completed = json.load(file)
+        self.category_names = load_category_names()
+
+    def category_complete(self, category: str, seen: Set[str] = frozenset()) -> bool:
+        # Every achievement of the category that isn't in `seen` was completed in the previous scan
+        names = self.category_names.get(category)
+        return bool(names) and all(is_completed(self.completed.get(name)) for name in names - seen)
+
+    def new_achievements(self, achievements: Dict[str, bool | int]) -> Dict[str, bool | int]:
+        return {title: completed for title, completed in achievements.items()
+                if completion_state(self.completed.get(title)) != completion_state(completed)}
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os.path
+import pickle
+import sys
+from typing import Dict, List
+
+from utils import get_asset_path
+
+# gc_achievements.json / gc_categories.json compiled into one pickled blob with every derived structure
+# the scanner and the uploader need, so startup doesn't parse and re-index the JSON every time.
+# Rebuild it with `python database.py` (build.cmd does) whenever the JSON assets change.
+logger = logging.getLogger("Database")
+format_version = 1
+
+
+def source_digest(paths: List[str]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class Database(object):
+    def __init__(self, gc_achievements: dict, gc_categories: dict):
+        self.category_names: Dict[int, str] = {int(k): sys.intern(v) for k, v in gc_categories.items()}
+        self.name_by_id: Dict[int, str] = {}
+        self.category_by_id: Dict[int, int] = {}
+        self.primo_by_id: Dict[int, int] = {}
+        self.ids_by_name: Dict[str, List[int]] = {}
+        self.ids_by_category: Dict[int, List[int]] = {}
+
+        for k, v in sorted(gc_achievements.items(), key=lambda item: int(item[0])):
+            achievement_id, name = int(k), sys.intern(v['name'])
+            self.name_by_id[achievement_id] = name
+            self.category_by_id[achievement_id] = v['category_id']
+            self.primo_by_id[achievement_id] = v['primo']
+            self.ids_by_name.setdefault(name, []).append(achievement_id)
+            self.ids_by_category.setdefault(v['category_id'], []).append(achievement_id)
+
+    @property
+    def achievement_names(self) -> List[str]:
+        return list(self.ids_by_name.keys())
+
+    def category_achievement_names(self, category: str) -> List[str]:
+        # Names of a category's achievements in database order, duplicates (steps) once
+        names = [self.name_by_id[i]
+                 for category_id, name in self.category_names.items() if name == category
+                 for i in self.ids_by_category.get(category_id, [])]
+        return list(dict.fromkeys(names))
+
+    @classmethod
+    def from_json(cls, assets: dict = None) -> "Database":
+        assets = assets or get_asset_path()
+        with open(assets['gc_achievements.json'], "r", encoding='utf-8') as file:
+            gc_achievements = json.load(file)
+        with open(assets['gc_categories.json'], "r", encoding='utf-8') as file:
+            gc_categories = json.load(file)
+        return cls(gc_achievements, gc_categories)
+
+    @classmethod
+    def from_compiled(cls, state: dict) -> "Database":
+        database = cls.__new__(cls)
+        database.__dict__.update(state)
+        return database
+
+
+def write_word_list(path: str, names: List[str]) -> str:
+    # Tesseract user-words (or patterns) file, every word of every name once. Every OCR worker calls this while
+    # other workers' tesseract may be reading the file, so it's only rewritten if it changed, and never in place.
+    content = "\n".join(sorted({word for name in names for word in name.split()})) + "\n"
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            if file.read() == content:
+                return path
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(content)
+    try:
+        os.replace(temporary, path)
+    except PermissionError:  # Windows, open in another process that is writing the same content
+        os.remove(temporary)
+    return path
+
+
+def characters(names: List[str]) -> str:
+    return "".join(sorted(set("".join(names)) - {" "}))
+
+
+def json_sources(assets: dict) -> List[str]:
+    return [assets['gc_achievements.json'], assets['gc_categories.json']]
+
+
+def build(assets: dict = None) -> Database:
+    assets = assets or get_asset_path()
+    database = Database.from_json(assets)
+    with open(assets['gc_database.pickle'], 'wb') as file:
+        # plain dicts only, so loading doesn't depend on where this module was imported from
+        pickle.dump({"version": format_version, "digest": source_digest(json_sources(assets)),
+                     "database": database.__dict__}, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return database
+
+
+def load(assets: dict = None) -> Database:
+    # Compiled blob if it's there and matches the JSON assets, JSON otherwise
+    assets = assets or get_asset_path()
+    if os.path.exists(assets['gc_database.pickle']):
+        with open(assets['gc_database.pickle'], 'rb') as file:
+            compiled = pickle.load(file)
+        if compiled.get("version") == format_version \
+                and compiled.get("digest") == source_digest(json_sources(assets)):
+            return Database.from_compiled(compiled["database"])
+        logger.warning("gc_database.pickle is stale, run database.py to rebuild it")
+    return Database.from_json(assets)
+
+
+_database: Database | None = None
+
+
+def get_database() -> Database:
+    global _database
+    if _database is None:
+        _database = load()
+    return _database
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    compiled = build()
+    logging.info(f"Compiled {len(compiled.name_by_id)} achievements and {len(compiled.category_names)} categories "
+                 f"into {get_asset_path()['gc_database.pickle']}")
@@ -0,0 +1,77 @@
+import logging
+import time
+from collections import Counter
+
+# Mouse and keyboard input to the game window. Counts every event sent and the time spent sending input
+# and waiting for the UI to react, which is most of a scan's wall time.
+logger = logging.getLogger("Inputs")
+
+
+class InputController(object):
+    wheel_pacing: float = 0.02  # seconds between wheel events, game drops the ones sent back-to-back
+    # pywinauto multiplies wheel_dist by 120, so this is a 12000 unit delta - and the game still scrolls one notch
+    # per event. Genshin ignores the delta's magnitude, that's why wheel input is paced by default.
+    paced_wheel_dist: int = -100
+
+    def __init__(self, window, batch_wheel: bool = False):
+        self.window = window
+        # True - try sending a whole scroll as one wheel event with a multi-notch delta, for games that honour it.
+        # Falls back to one event per notch after the first scroll if the game doesn't (see wheel_moved_one_notch).
+        self.batch_wheel = batch_wheel
+        self.wheel_verified = not batch_wheel
+        self.events: Counter = Counter()
+        self.input_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def click(self, coords: tuple):
+        start = time.perf_counter()
+        self.window.click_input(button='left', coords=coords)
+        self.count("click", start)
+
+    def press(self, keys: str):
+        start = time.perf_counter()
+        self.window.type_keys(keys)
+        self.count("key", start)
+
+    def scroll(self, steps: int, coords: tuple):
+        # Scrolls the list under `coords` down by `steps` notches
+        start = time.perf_counter()
+        if self.batch_wheel:
+            self.window.wheel_mouse_input(coords=coords, wheel_dist=-steps)
+            self.count("wheel", start)
+            return
+        for scrolled in range(steps):
+            if scrolled > 0:
+                time.sleep(self.wheel_pacing)
+            self.window.wheel_mouse_input(coords=coords, wheel_dist=self.paced_wheel_dist)
+            self.count("wheel", start)
+            start = time.perf_counter()
+
+    def wheel_moved_one_notch(self, steps: int, moved_notches: float) -> bool:
+        # Called with how far the first multi-notch scroll went. Games that read one notch per wheel event
+        # move about a notch, from then on every notch is sent on its own. True - `steps - 1` are still to go.
+        if self.wheel_verified or steps < 2 or moved_notches <= 0:
+            return False
+        self.wheel_verified = True
+        if moved_notches < 1.5:
+            logger.warning(f"Wheel event of {steps} notches scrolled {moved_notches:.1f}, sending notches one by one")
+            self.batch_wheel = False
+            return True
+        logger.info(f"Wheel event of {steps} notches scrolled {moved_notches:.1f}, keeping batched scrolls")
+        return False
+
+    def waited(self, seconds: float):
+        self.wait_seconds += seconds
+
+    def count(self, kind: str, start: float):
+        self.events[kind] += 1
+        self.input_seconds += time.perf_counter() - start
+
+    def stats(self, achievements: int = 0) -> dict:
+        stats = {"events": dict(self.events), "input_seconds": round(self.input_seconds, 2),
+                 "wait_seconds": round(self.wait_seconds, 2),
+                 "wheel": "batched" if self.batch_wheel else "paced"}
+        if achievements > 0:
+            stats["events_per_achievement"] = round(sum(self.events.values()) / achievements, 2)
+            stats["seconds_per_achievement"] = round((self.input_seconds + self.wait_seconds) / achievements, 3)
+        return stats
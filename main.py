@@ -1,20 +1,30 @@
+import argparse
 import ctypes
-import io
 import json
 import logging
+import multiprocessing
+import os.path
 import sys
-from time import sleep
-from typing import Dict, List, Tuple
+from typing import Dict, List, Set, Tuple
 
-from PIL import ImageOps, Image
-from rapidfuzz import process, fuzz
-from rapidfuzz.utils import default_process
+import numpy as np
+from PIL import Image
 from pywinauto import Application
 from pywinauto.controls.hwndwrapper import DialogWrapper
 from pywinauto.win32structures import RECT
 
-from utils import find_process, scale_coords_to_resolution, scale_box_to_resolution, bold_color_mask, \
-    generate_achievement_boxes, scan_image, get_asset_path
+import recognition
+from capture import backends, create_backend
+from checkpoint import CheckpointLog, PreviousScan
+from inputs import InputController
+from ocr import find_tesseract
+from ocr_cache import OCRCache, set_cache
+from pipeline import ScanPipeline
+from scroll_tracking import ScrollTracker, visible_rows
+from session import SessionRecorder, policies
+from tracing import Tracer, get_tracer, set_tracer, span
+from waits import wait_for_stable_frame
+from utils import find_process, scale_coords_to_resolution, scale_box_to_resolution, generate_achievement_boxes
 
 button_coords = {
     "main_achievement_button": (885, 542),
@@ -28,52 +38,65 @@ box_coords = {
     # "achievement": RECT(1167, 208, 878, 138),
     # "achievement_categories": RECT(1167, 393, 878, 138),
     # "achievement_status": RECT(2208, 195, 220, 161),
+    # small regions polled by wait_for_ui, they have to change whenever the UI behind them does
+    "wait_achievement_list": RECT(1200, 200, 400, 250),
+    "wait_category_list": RECT(173, 260, 500, 300),
+    "wait_screen": RECT(880, 500, 800, 440),
+    # scrolling lists, snapshots of these are registered against each other to tell how far they moved
+    "achievement_list": RECT(1167, 170, 1273, 1122),
+    "category_list": RECT(152, 235, 718, 1090),
 }
+# (title, status) of the first row of a freshly opened category, the rest are row_pitch apart
+row_layouts = {
+    "achievement": (RECT(1167, 176, 878, 138), RECT(2208, 176, 220, 138)),
+    "namecard": (RECT(1167, 400, 900, 126), RECT(2224, 400, 192, 126)),  # list starts below the namecard
+}
+row_pitch = 167
+category_pitch = 138
+wheel_notch = 835 / 35  # scrolled by one wheel notch, refined while scanning (35 notches were ~5 rows)
 
 
 class AchievementScanner(object):
-    debug_mode: bool = True
+    debug_mode: bool = True  # records raw crops into session_path in the background, see replay.py
+    session_path: str = os.path.join('results', 'session.zip')
+    session_policy: str = 'all'  # which crops to keep, see session.policies
+    session_every: int = 10  # every_nth policy
+    session_compresslevel: int = 1  # 0 - store pixel data uncompressed, fastest
+    session_max_mb: int | None = 2048  # crops past this much pixel data are dropped
+    results_path: str = os.path.join('results', 'achievements.json')
+    new_results_path: str = os.path.join('results', 'new_achievements.json')  # incremental scans only
+    checkpoint_path: str = os.path.join('results', 'checkpoint.jsonl')
     debug_disable_postprocessing: bool = False
+    pipeline_workers: int | None = None  # OCR worker processes, None - one per core, 0 - scan in the UI thread
+    # OCR results kept between scans, None - disabled
+    ocr_cache_path: str | None = os.path.join('results', 'ocr_cache.json.gz')
+    batch_ocr: bool = True  # OCR a page of titles (and statuses) in one call instead of row by row
+    page_snapshot: bool = True  # one window capture per page, all boxes are cropped from it
+    capture_backend: str | None = None  # see capture.create_backend, None - the fastest one available
+    batch_wheel: bool = False  # try one multi-notch wheel event per scroll, the game reads one notch per event
+    wait_min_settle: float = 0.1  # seconds, UI needs a couple of frames to start reacting to input
+    trace_path: str = os.path.join('results', 'trace.json')  # --trace, Chrome trace events of every stage
+    timings_path: str = os.path.join('results', 'timings.json')  # --trace, per-stage and per-achievement timings
     window_rect: RECT = None
 
     buttons: Dict[str, tuple] = {}  # both are scaled for user's resolution
     boxes: Dict[str, RECT] = {}
+    page_frame: np.ndarray | None = None  # whole window, as of the last capture_page()
 
     achievements: Dict[str, bool] = {}  # title - completed
     categories: List[str] = []
-    database: List[str] = []
 
     # loop
     achievement_id: int = 0
     category_id: int = 0
+    current_category: str | None = None  # database name of the category being scanned
 
     def scale_for_resolution(self):
-        end_achievement = RECT(1167, 1148, 881, 140)
-        end_achievement_status = RECT(2219, 1148, 220, 140)
-        end_achievement_adjust = 167
-        box_coords.update(generate_achievement_boxes(end_achievement, end_achievement_status, end_achievement_adjust,
-                                                     key="end_achievement", count=5))
-
         end_category = RECT(173, 1213, 697, 109)
         end_category_adjust = 138
         box_coords.update(generate_achievement_boxes(end_category, None, end_category_adjust,
                                                      key="end_category", count=7))
 
-        start_achievement_category = RECT(1167, 400, 900, 126)
-        start_achievement_category_status = RECT(2224, 400, 192, 126)
-        start_achievement_category_adjust = 167
-        box_coords.update(
-            generate_achievement_boxes(start_achievement_category, start_achievement_category_status,
-                                       start_achievement_category_adjust,
-                                       key="start_achievement_category", count=5, inversed=True))
-
-        start_achievement = RECT(1167, 176, 878, 138)
-        start_achievement_status = RECT(2208, 176, 220, 138)
-        start_achievement_adjust = 167
-        box_coords.update(
-            generate_achievement_boxes(start_achievement, start_achievement_status, start_achievement_adjust,
-                                       key="start_achievement", count=5, inversed=True))
-
         self.window_rect = self.window.element_info.rectangle
         resolution = (self.window_rect.width(), self.window_rect.height())
         self.buttons = {k: scale_coords_to_resolution(v, resolution) for k, v in button_coords.items()}
@@ -83,57 +106,55 @@ class AchievementScanner(object):
     def __init__(self, window: DialogWrapper):
         self.window = window
         self.logger = logging.getLogger("AchievementScanner")
+        self.ocr_cache = OCRCache.load(self.ocr_cache_path) if self.ocr_cache_path is not None else None
+        set_cache(self.ocr_cache)
+        self.pipeline = ScanPipeline(self.pipeline_workers, postprocess=not self.debug_disable_postprocessing,
+                                     cache=self.ocr_cache)
         self.scale_for_resolution()
+        self.capture = create_backend(self.window_rect, window, self.capture_backend)
+        self.logger.info(f"Capturing with {self.capture.name}")
+        self.input = InputController(window, self.batch_wheel)
+        self.page_rows: List[Tuple[int, Image.Image, Image.Image]] = []  # captured, not yet sent to the pipeline
+        self.checkpoint: CheckpointLog | None = None
+        self.previous: PreviousScan | None = None
+        self.recorder = None
+        if self.debug_mode:
+            self.recorder = SessionRecorder(
+                self.session_path, metadata={"resolution": (self.window_rect.width(), self.window_rect.height())},
+                policy=self.session_policy, every=self.session_every, compresslevel=self.session_compresslevel,
+                max_bytes=self.session_max_mb * 2 ** 20 if self.session_max_mb is not None else None)
 
-    def scroll_mouse(self, steps: int, coords: tuple):
+    def scroll_mouse(self, steps: int, coords: tuple, wait_key: str = 'wait_achievement_list'):
         self.logger.debug(f"Scrolling {steps} times at {coords}")
-        max_scroll = steps
-        scrolled = 0
-        while scrolled < max_scroll:
-            self.window.wheel_mouse_input(coords=coords, wheel_dist=-100)
-            scrolled += 1
-            sleep(0.02)
-            self.logger.debug(f"{scrolled} / {max_scroll}")
-        sleep(0.5)
-
-    def adjust_scroll_steps(self, category: bool = False):
-        steps = 35
-        if self.achievement_id % 15 == 0:
-            steps -= 1
-        """
-        if self.achievement_id % 14 == 0 or self.achievement_id % 41 == 0:
-            steps -= 1
-        if self.achievement_id % 42 == 0:
-            steps += 1
-        """
-
-        if category:
-            steps = 6
-            if self.category_id % 4 == 0:
-                steps -= 1
-            if self.category_id % 33 == 0:
-                steps -= 1
-
-        return steps
-
-    @staticmethod
-    def improve_achievement_text(image: Image.Image) -> Image.Image:
-        improved = ImageOps.expand(image, border=20, fill='#f0e9dc')
-        improved = bold_color_mask(improved)
-        improved = ImageOps.grayscale(improved)
-        return improved
-
-    @staticmethod
-    def improve_achievement_status(image: Image.Image) -> Image.Image:
-        improved = bold_color_mask(image, target_color=(187, 167, 145), threshold=50)
-        improved = ImageOps.grayscale(improved)
-        return improved
-
-    @staticmethod
-    def improve_achievement_category(image: Image.Image) -> Image.Image:
-        improved = bold_color_mask(image, target_color=(73, 83, 102), threshold=100)
-        improved = ImageOps.grayscale(improved)
-        return improved
+        self.page_frame = None
+        with span("scroll_mouse", steps=steps):
+            self.input.scroll(steps, coords)
+            self.wait_for_ui(wait_key, timeout=1)
+
+    def scroll_list(self, tracker: ScrollTracker, steps: int, coords: tuple, wait_key: str, box_key: str) -> float:
+        # Scrolls, takes a page snapshot and returns how far the list moved (base pixels)
+        self.scroll_mouse(steps, coords, wait_key=wait_key)
+        self.capture_page()
+        moved = tracker.update(self.grab_box(box_key), steps)
+        if self.input.wheel_moved_one_notch(steps, moved / tracker.notch):
+            self.scroll_mouse(steps - 1, coords, wait_key=wait_key)
+            self.capture_page()
+            moved += tracker.update(self.grab_box(box_key), steps - 1)
+        return moved
+
+    def wait_for_ui(self, box_key: str, timeout: float) -> float:
+        # Returns as soon as the region stops changing, `timeout` is the delay that used to be a fixed sleep
+        with span(f"wait_for_ui:{box_key}", timeout=timeout):
+            elapsed = wait_for_stable_frame(lambda: self.capture.grab(self.boxes[box_key]),
+                                            timeout=timeout, min_settle=min(self.wait_min_settle, timeout),
+                                            name=box_key)
+        self.input.waited(elapsed)
+        self.logger.debug(f"Waited {elapsed:.3f}s / {timeout:.1f}s for {box_key}")
+        return elapsed
+
+    improve_achievement_text = staticmethod(recognition.improve_achievement_text)
+    improve_achievement_status = staticmethod(recognition.improve_achievement_status)
+    improve_achievement_category = staticmethod(recognition.improve_achievement_category)
 
     def left_click(self, coords: tuple):
         self.logger.debug(f"Clicking at {coords}")
@@ -141,51 +162,48 @@ class AchievementScanner(object):
         if coords[0] > max_width or coords[1] > max_height:
             self.logger.warning(f"Coords {coords} are out of window bounds ({max_width}, {max_height})")
 
-        self.window.click_input(button='left', coords=coords)
+        with span("left_click"):
+            self.input.click(coords)
 
     def go_to_achievements(self):
         for _ in range(0, 4):
-            self.window.type_keys('{ESC}')
-            sleep(1)
+            with span("type_keys"):
+                self.input.press('{ESC}')
+            self.wait_for_ui('wait_screen', timeout=1)
         self.left_click(coords=self.buttons['main_achievement_button'])
-        sleep(2)
+        self.wait_for_ui('wait_screen', timeout=2)
         self.left_click(coords=self.buttons['main_achievement_category'])
-        sleep(2)
+        self.wait_for_ui('wait_achievement_list', timeout=2)
 
     def load_database(self):
-        if len(self.database) == 0:
-            assets = get_asset_path()
-
-            with open(assets['gc_achievements.json'], "r", encoding='utf-8') as file:
-                gc_achievements = json.load(file)
-            gc_achievements = [v['name'] for k, v in gc_achievements.items()]
-            with open(assets['gc_categories.json'], "r", encoding='utf-8') as file:
-                gc_categories = json.load(file)
-            gc_categories = [v for k, v in gc_categories.items()]
-            self.database = gc_achievements + gc_categories
-            self.database.sort()  # Leads to faster results down the line
-        return
-
-    def fix_title_by_database(self, title: str):
-        self.load_database()
-        result, confidence, choices_type = process.extractOne(title, self.database, processor=default_process)
-        self.logger.info(f"fix_title_by_database: {title} -> {result} ({confidence} / {choices_type})")
-        if confidence >= 90.0:
-            return result
-        else:
-            return title
-
-    def capture_image(self, box: RECT, improve_func: callable = None, debug_name: str = None):
-        image = self.window.capture_as_image(rect=box)
-        if improve_func and not self.debug_disable_postprocessing:
-            image = improve_func(image)
-        image_bytes = io.BytesIO()
-        image.save(image_bytes, format='PNG')
-        if self.debug_mode:
-            image_path = f'results\\debug_images\\{debug_name}.png'
-            image.save(image_path)
-
-        return image_bytes
+        recognition.load_database()
+
+    def fix_title_by_database(self, title: str, kind: str = "achievement"):
+        return recognition.fix_title_by_database(title, kind)
+
+    def capture_page(self):
+        self.page_frame = None
+        if self.page_snapshot:
+            with span("capture_page"):
+                self.page_frame = self.capture.grab_array()
+
+    def grab_box(self, box_key: str) -> Image.Image:
+        if self.page_frame is not None:
+            # boxes are in screen coords, the frame starts at the window's corner
+            box = self.boxes[box_key]
+            left, top = int(self.window_rect.left), int(self.window_rect.top)
+            return Image.fromarray(self.page_frame[int(box.top) - top:int(box.bottom) - top,
+                                                   int(box.left) - left:int(box.right) - left])
+        return self.capture.grab(self.boxes[box_key])
+
+    def capture_image(self, box_key: str, kind: str) -> Image.Image:
+        with span(f"capture_image:{kind}"):
+            image = self.grab_box(box_key)
+        if self.recorder is not None:
+            with span("record_session"):
+                self.recorder.record(image, kind, box_key, self.achievement_id, self.category_id)
+
+        return image
 
     def get_center_of_rect(self, box: RECT) -> Tuple[int, int]:
         x, y = int(box.left), int(box.top)
@@ -199,147 +217,222 @@ class AchievementScanner(object):
 
         return x, y
 
-    def scan_achievement(self, achievement_name_rect: RECT, status_rect: RECT):
-        # Capture
+    def set_row_boxes(self, box_key: str, title_box: RECT, status_box: RECT, shift: float):
+        # Boxes of a row `shift` base pixels below where it is in a freshly opened category
+        for key, box in ((box_key, title_box), (f"{box_key}_status", status_box)):
+            self.boxes[key] = scale_box_to_resolution(RECT(box.left, int(box.top + shift), box.right, box.bottom),
+                                                      self.window_rect)
+
+    def scan_achievement(self, box_key: str):
+        # Capture, everything else happens in the pipeline
         self.logger.info(f"Capturing achievement {self.achievement_id}")
-        self.left_click(coords=self.get_center_of_rect(achievement_name_rect))
-        title_image_bytes = self.capture_image(achievement_name_rect, improve_func=self.improve_achievement_text,
-                                               debug_name=f"{self.achievement_id}")
-        status_image_bytes = self.capture_image(status_rect, improve_func=self.improve_achievement_status,
-                                                debug_name=f"{self.achievement_id}_status")
-
-        # Scan
-        self.logger.info(f"Sending {self.achievement_id} over for scanning to OCR server")
-        self.left_click(coords=self.get_center_of_rect(status_rect))
-        scanned_title: str = scan_image(title_image_bytes.getvalue())
-        scanned_status: str = scan_image(status_image_bytes.getvalue())
-
-        # Fix small fuckups
-        scanned_title = scanned_title.strip()
-        if scanned_title == '':
-            return '', False
-        if scanned_title == "":
-            scanned_title = "\n"  # so .splitlines doesn't crash the thing
-        scanned_title = scanned_title.splitlines()[0].replace(
-            "”", "\"").replace("“", "\"").replace('Deja', 'Déjà')
-        scanned_title = self.fix_title_by_database(scanned_title)
-
-        # OCR Result
-        self.logger.info(f"Found achievement {self.achievement_id}: {scanned_title}")
-        self.logger.info(f"Status: {scanned_status}")
-        return scanned_title, fuzz.partial_ratio("Completed", scanned_status, processor=default_process) >= 90.0
-
-    def scan_category(self, category_name_rect, skip: bool = False):
-        end_of_list_mode = False  # debug switch
-        if end_of_list_mode:
-            for _ in range(int(285 / 5)):
-                self.scroll_mouse(35, self.buttons['achievement_scroll'])
-
-        category_image_bytes = self.capture_image(category_name_rect, improve_func=self.improve_achievement_category,
-                                                  debug_name=f"category_{self.category_id}")
-        scanned_category: str = scan_image(category_image_bytes.getvalue()).strip().replace('and\nEternity',
-                                                                                            'and Eternity')
-        scanned_category = self.fix_title_by_database(scanned_category)
+        if get_tracer() is not None:
+            get_tracer().context.update(achievement_id=self.achievement_id, category_id=self.category_id)
+        click = self.page_frame is None  # rows in a page snapshot are already on screen, no need to click on them
+        if click:
+            self.left_click(coords=self.get_center_of_rect(self.boxes[box_key]))
+        title_image = self.capture_image(box_key, "title")
+        status_image = self.capture_image(f"{box_key}_status", "status")
+        if click:
+            self.left_click(coords=self.get_center_of_rect(self.boxes[f"{box_key}_status"]))
+
+        self.page_rows.append((self.achievement_id, title_image, status_image))
+        if not self.batch_ocr:
+            self.submit_page()
+
+    def submit_page(self):
+        if len(self.page_rows) == 0:
+            return
+        achievement_ids, title_images, status_images = (list(column) for column in zip(*self.page_rows))
+        self.logger.info(f"Sending {achievement_ids} over for scanning to OCR workers")
+        self.pipeline.submit_page(achievement_ids, title_images, status_images, self.current_category)
+        self.page_rows = []
+
+    def review_crops(self, achievement_id: int, title: str, confidence: float):
+        # Recorder policies that keep only doubtful rows decide once the row is recognized
+        if self.recorder is not None:
+            self.recorder.resolve(achievement_id, title, confidence)
+
+    def record_achievement(self, category: str, title: str, completed: bool | int):
+        if self.checkpoint is not None:
+            self.checkpoint.achievement(category, title, completed)
+        if completed:
+            self.achievements[title] = completed
+
+    def collect_achievements(self, category: str, scanned: Set[str], wait: bool = False) -> bool:
+        # Merges finished results in scan order. The scroll tracker finds the end of the list, this only returns True
+        # for incremental scans, once the rest of the category was completed in the previous scan.
+        # Every row is read once, a repeated title is a misread or a fuzzy match and doesn't end the category.
+        for achievement_id, title, completed, confidence in self.pipeline.results(wait=wait):
+            self.review_crops(achievement_id, title, confidence)
+            scanned.add(title)
+            self.record_achievement(category, title, completed)
+
+            if self.previous is not None and self.previous.category_complete(category, scanned):
+                self.logger.info(f"Rest of {category} was completed in the previous scan")
+                return True
+        return False
+
+    def scan_category(self, box_key: str, skip: bool = False):
+        finished = self.checkpoint.finished.get(self.category_id) if self.checkpoint is not None else None
+        if finished is not None:  # resumed scan
+            self.logger.info(f"Category {self.category_id} ({finished['name']}) was scanned before, skipping")
+            self.achievement_id = finished["achievement_id"]
+            if finished["name"] not in self.categories:
+                self.categories.append(finished["name"])
+            return finished["name"]
+
+        self.capture_page()
+        category_image = self.capture_image(box_key, "category")
+        scanned_category = recognition.recognize_category(category_image,
+                                                          postprocess=not self.debug_disable_postprocessing)
         self.logger.info(f"Found category {self.category_id}: {scanned_category}")
         if scanned_category in self.categories or skip:
             return scanned_category
         self.categories.append(scanned_category)
+        if self.previous is not None and self.previous.category_complete(scanned_category):
+            self.logger.info(f"{scanned_category} was completed in the previous scan, skipping")
+            return scanned_category
 
-        last_achievement = None
-        skip_scroll = True
-        scanned = []
-        while not end_of_list_mode:
-            if not skip_scroll:
-                self.logger.info(f"Scrolling...")
-                self.scroll_mouse(self.adjust_scroll_steps(), self.buttons['achievement_scroll'])
-                sleep(0.5)
-
-            for i in range(0, 5):  # scan start-of-page items
+        self.current_category = scanned_category
+        scanned: Set[str] = set()
+        title_box, status_box = row_layouts["achievement" if self.category_id <= 2 else "namecard"]
+        row_height = max(title_box.bottom, status_box.bottom)  # base boxes are (left, top, width, height)
+        view = box_coords['achievement_list']
+        tracker = ScrollTracker(wheel_notch, self.window_rect.height() / 1440)
+        tracker.reset(self.grab_box('achievement_list'))
+        next_row = 0
+        while True:
+            rows = [(row, top) for row, top in visible_rows(title_box.top, row_pitch, row_height, view.top,
+                                                             view.top + view.bottom, tracker.position)
+                    if row >= next_row]
+            if len(rows) > 0 and rows[0][0] > next_row:
+                self.logger.warning(f"Scrolled past rows {next_row}-{rows[0][0] - 1} of {scanned_category}")
+            for i, (row, top) in enumerate(rows):  # only rows that weren't on the previous page
                 self.achievement_id += 1
-                skip_scroll = False
-
-                if self.category_id <= 2:
-                    self.logger.info('Selected normal achievement boxes')
-                    achievement_name_rect = self.boxes[f"start_achievement_{i}"]
-                    status_rect = self.boxes[f"start_achievement_{i}_status"]
-                else:
-                    self.logger.info('Selected namecard achievement boxes')
-                    achievement_name_rect = self.boxes[f"start_achievement_category_{i}"]
-                    status_rect = self.boxes[f"start_achievement_category_{i}_status"]
-
-                title, completed = self.scan_achievement(achievement_name_rect, status_rect)
-
-                # In-case we are stuck (end-of-page)
-                if last_achievement == title or title in scanned:
-                    end_of_list_mode = True
-                    break
-                else:
-                    last_achievement = title
-                    scanned.append(title)
-
-                if completed:
-                    self.achievements[title] = completed
-
-        for i in range(0, 5):  # scan end-of-page items
-            self.achievement_id += 1
-            achievement_name_rect = self.boxes[f"end_achievement_{i}"]
-            status_rect = self.boxes[f"end_achievement_{i}_status"]
-
-            title, completed = self.scan_achievement(achievement_name_rect, status_rect)
-            if completed:
-                self.achievements[title] = completed
+                self.set_row_boxes(f"row_{i}", title_box, status_box, top - title_box.top)
+                self.scan_achievement(f"row_{i}")
+            if len(rows) > 0:
+                next_row = rows[-1][0] + 1
+            self.submit_page()
+            if self.collect_achievements(scanned_category, scanned):
+                break
 
-            if title in scanned:  # leave faster whenever possible (caught on Challenger IV)
+            # two rows of overlap, so the next snapshot can be registered against this one
+            steps = tracker.steps_for(view.bottom - 2 * row_pitch)
+            self.logger.info(f"Scrolling...")
+            if self.scroll_list(tracker, steps, self.buttons['achievement_scroll'], 'wait_achievement_list',
+                                'achievement_list') < 1:
+                self.logger.info(f"End of {scanned_category}")
                 break
 
+        self.collect_achievements(scanned_category, scanned, wait=True)
+        self.pipeline.discard()
         return scanned_category
 
+    def category_finished(self) -> bool:
+        return self.checkpoint is not None and self.category_id in self.checkpoint.finished
+
+    def finish_category(self, category_name: str):
+        if self.checkpoint is not None and not self.category_finished():
+            self.checkpoint.category_done(self.category_id, category_name, self.achievement_id)
+
     def scan_categories(self):
         skip_data = False  # debug switch
 
         last_category = None
+        tracker = ScrollTracker(wheel_notch, self.window_rect.height() / 1440)
         while True:
             self.category_id += 1
-            if self.category_id != 1:
+            if self.category_id == 1:
+                self.capture_page()
+                tracker.reset(self.grab_box('category_list'))
+            else:
                 self.logger.info(f"Scrolling to category {self.category_id}")
                 self.left_click(coords=self.buttons['category_scroll'])
-                sleep(0.5)
-                self.scroll_mouse(self.adjust_scroll_steps(category=True), self.buttons['category_scroll'])
-                sleep(0.5)
-                self.logger.info(f"Clicking on category {self.category_id}")
-                self.left_click(coords=self.buttons['achievement_category'])
-                sleep(0.5)
+                self.wait_for_ui('wait_category_list', timeout=0.5)
+                # aim at where this category should be, so rounding errors don't pile up
+                target = (self.category_id - 1) * category_pitch
+                steps = tracker.steps_for(target - tracker.position)
+                self.scroll_list(tracker, steps, self.buttons['category_scroll'], 'wait_category_list',
+                                 'category_list')
+                if tracker.position < target - category_pitch / 2:
+                    self.logger.info(f"Category list ended before category {self.category_id}")
+                    self.category_id -= 1
+                    break
+                if not self.category_finished():
+                    self.logger.info(f"Clicking on category {self.category_id}")
+                    self.left_click(coords=self.buttons['achievement_category'])
+                    self.wait_for_ui('wait_achievement_list', timeout=0.5)
 
             self.logger.info(f"Scanning category {self.category_id}")
-            category_name = self.scan_category(self.boxes['achievement_category'], skip=skip_data)
+            category_name = self.scan_category('achievement_category', skip=skip_data)
+            self.finish_category(category_name)
             if category_name == last_category:
                 break
             last_category = category_name
-            sleep(1)
+            self.wait_for_ui('wait_category_list', timeout=1)
 
         for i in range(0, 7):
             self.category_id += 1
             self.logger.info(f"Scanning category (end-of-page) {self.category_id}")
-            category_box: RECT = self.boxes[f"end_category_{i}"]
-            self.left_click(coords=self.get_center_of_rect(category_box))
-            sleep(0.5)
-            category_name = self.scan_category(category_box, skip=skip_data)
+            if not self.category_finished():
+                self.left_click(coords=self.get_center_of_rect(self.boxes[f"end_category_{i}"]))
+                self.wait_for_ui('wait_achievement_list', timeout=0.5)
+            category_name = self.scan_category(f"end_category_{i}", skip=skip_data)
+            self.finish_category(category_name)
             if category_name is None:
                 break
 
         return
 
     @classmethod
-    def run(cls):
+    def run(cls, resume: bool = False, incremental: bool = False, trace: bool = False, session_policy: str = None,
+            capture_backend: str = None):
+        if trace:
+            set_tracer(Tracer())
+        if session_policy == 'off':
+            cls.debug_mode = False
+        elif session_policy is not None:
+            cls.session_policy = session_policy
+        if capture_backend is not None:
+            cls.capture_backend = capture_backend
         app = Application().connect(process=find_process("GenshinImpact.exe").pid)
         main_window: DialogWrapper = app.windows()[0]
         main_window.set_focus()
 
         inst = cls(main_window)
-        inst.go_to_achievements()
-        inst.scan_categories()
-        with open('results\\achievements.json', 'w') as file:
+        if incremental:
+            inst.previous = PreviousScan(inst.results_path)
+            inst.achievements = dict(inst.previous.completed)  # skipped rows and categories carry over
+        inst.checkpoint = CheckpointLog(inst.checkpoint_path, resume=resume)
+        inst.achievements.update(inst.checkpoint.achievements)
+        try:
+            inst.go_to_achievements()
+            inst.scan_categories()
+        finally:
+            inst.checkpoint.close()
+            inst.pipeline.close()
+            inst.capture.close()
+            inst.logger.info(f"Capture: {inst.capture.stats()}")
+            inst.logger.info(f"Input: {inst.input.stats(inst.achievement_id)}")
+            if inst.recorder is not None:
+                inst.recorder.close()
+                inst.logger.info(f"Session: {inst.recorder.stats()}")
+            if inst.ocr_cache is not None:
+                inst.ocr_cache.save()
+                inst.logger.info(f"OCR cache: {inst.ocr_cache.stats()}")
+            if get_tracer() is not None:
+                get_tracer().save(inst.trace_path, inst.timings_path)
+                inst.logger.info(f"Timings saved to {inst.timings_path}, trace to {inst.trace_path}:\n"
+                                 f"{get_tracer().summary()}")
+        with open(inst.results_path, 'w') as file:
             json.dump(inst.achievements, file, indent=4)
+        if inst.previous is not None:
+            new_achievements = inst.previous.new_achievements(inst.achievements)
+            inst.logger.info(f"{len(new_achievements)} achievements completed since the previous scan")
+            with open(inst.new_results_path, 'w') as file:
+                json.dump(new_achievements, file, indent=4)
         return inst
 
 
@@ -351,9 +444,7 @@ def is_admin():
 
 
 def check_if_tesseract_is_available():
-    default_tesseract_path = "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
-    import os
-    if not os.path.exists(default_tesseract_path):
+    if find_tesseract() is None:
         print("Tesseract не установлен. Пожалуйста, установите его из интернета.")
         print("Tesseract is not installed. Please, install it from the web.")
         print("https://digi.bib.uni-mannheim.de/tesseract/tesseract-ocr-w64-setup-5.3.3.20231005.exe")
@@ -362,6 +453,20 @@ def check_if_tesseract_is_available():
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # OCR workers in the frozen exe
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted scan, categories it finished are skipped")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only look for achievements completed since the previous scan")
+    parser.add_argument("--trace", action="store_true",
+                        help="Time every stage, save a Chrome trace and timing stats to results")
+    parser.add_argument("--session", choices=policies + ["off"], dest="session_policy",
+                        help="Which raw crops to record for replay.py, defaults to all")
+    parser.add_argument("--capture", dest="capture_backend", metavar="BACKEND",
+                        help=f"Screen capture backend ({', '.join(backends)}) or a directory of window screenshots "
+                             "(*.png) to use instead of the screen, defaults to the fastest backend available")
+    args = parser.parse_args()
     if is_admin():
         logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         logging.getLogger('PIL').setLevel(logging.WARNING)
@@ -371,7 +476,8 @@ if __name__ == '__main__':
             sys.exit(1)
         # input("Press \"Enter\" to start ")
         try:
-            AchievementScanner.run()
+            AchievementScanner.run(resume=args.resume, incremental=args.incremental, trace=args.trace,
+                                   session_policy=args.session_policy, capture_backend=args.capture_backend)
         except Exception as exc:
             logging.exception(exc)
         input("Press \"Enter\" to exit ")
@@ -0,0 +1,151 @@
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Set, Tuple
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex(object):
+    # Names pre-normalized once, with exact lookups and a trigram index to prune fuzzy candidates
+    min_shared_trigrams: float = 0.3
+    max_length_ratio: float = 8.0  # WRatio can't reach 90 past this length ratio
+
+    def __init__(self, names: List[str]):
+        self.names = sorted(set(names))
+        self.processed = [default_process(name) for name in self.names]
+        self.exact: Dict[str, str] = {name: name for name in self.names}
+        self.normalized: Dict[str, str] = {}
+        for name, processed in zip(self.names, self.processed):
+            self.normalized.setdefault(processed, name)
+
+        self.trigrams: Dict[str, List[int]] = {}
+        for i, processed in enumerate(self.processed):
+            for trigram in trigrams(processed):
+                self.trigrams.setdefault(trigram, []).append(i)
+
+    def candidates(self, query: str) -> List[int] | None:
+        query_trigrams = trigrams(query)
+        if len(query_trigrams) == 0:
+            return None  # too short to prune, score everything
+
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self.trigrams.get(trigram, ()))
+        needed = max(1, int(len(query_trigrams) * self.min_shared_trigrams))
+        candidates = []
+        for i, count in shared.items():
+            lengths = sorted((len(query), len(self.processed[i])))
+            if count >= needed and lengths[1] <= self.max_length_ratio * lengths[0]:
+                candidates.append(i)
+        return candidates
+
+    def search(self, query: str, score_cutoff: float, scorer: Callable = fuzz.WRatio) -> Tuple[str, float] | None:
+        candidates = self.candidates(query)
+        if candidates:
+            result = process.extractOne(query, [self.processed[i] for i in candidates], scorer=scorer,
+                                        processor=None, score_cutoff=score_cutoff)
+            if result is not None:
+                return self.names[candidates[result[2]]], result[1]
+        # Nothing close enough among candidates, fall back to scoring every name
+        result = process.extractOne(query, self.processed, scorer=scorer, processor=None, score_cutoff=score_cutoff)
+        if result is not None:
+            return self.names[result[2]], result[1]
+        return None
+
+
+class TitleMatcher(object):
+    # Achievement titles are looked up in this order: exact, the next few titles of the current category
+    # (the list is in database order), the whole category, everything.
+    prediction_window: int = 3
+    # a handful of expected names can't be confused with each other as easily as a thousand,
+    # so noisier reads are accepted there (score_cutoff still applies to the global search).
+    # Plain ratio, WRatio's partial matching lets short names match as substrings of longer reads.
+    prediction_cutoff: float = 75.0
+    category_cutoff: float = 85.0
+    scoped_scorer: Callable = fuzz.ratio
+
+    def __init__(self, achievements: List[str], categories: List[str], cache_size: int = 2048,
+                 score_cutoff: float = 90.0, category_achievements: Dict[str, List[str]] = None):
+        self.indexes = {
+            "achievement": NameIndex(achievements),
+            "category": NameIndex(categories),
+        }
+        self.category_achievements = category_achievements or {}  # category - titles in database order
+        self.category_indexes: Dict[str, NameIndex] = {}
+        self.positions: Dict[str, Dict[str, int]] = {}  # category - {title: position}
+        self.cache_size = cache_size
+        self.cache: OrderedDict[Tuple[str, str | None, str | None, str], Tuple[str, float]] = OrderedDict()
+        self.score_cutoff = score_cutoff
+        self.stats: Counter = Counter()  # where matches were found
+
+    def match(self, title: str, kind: str = "achievement", category: str = None,
+              previous: str = None) -> Tuple[str, float]:
+        # Returns (database name, confidence), or (title, 0.0) if nothing is close enough.
+        # `category` and `previous` (the title of the row above) narrow down achievement candidates.
+        if kind != "achievement" or category not in self.category_achievements:
+            category = None
+        key = (kind, category, previous if category is not None else None, title)  # predictions depend on previous
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.stats["cached"] += 1
+            return self.cache[key]
+
+        result = self._match(title, self.indexes[kind], category, previous)
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def _match(self, title: str, index: NameIndex, category: str = None,
+               previous: str = None) -> Tuple[str, float]:
+        if title in index.exact:
+            self.stats["exact"] += 1
+            return title, 100.0
+
+        query = default_process(title)
+        if query in index.normalized:
+            self.stats["exact"] += 1
+            return index.normalized[query], 100.0
+
+        if category is not None:
+            result = self._predict(query, category, previous)
+            if result is not None:
+                self.stats["predicted"] += 1
+                return result
+            result = self._category_index(category).search(query, self.category_cutoff, self.scoped_scorer)
+            if result is not None:
+                self.stats["category"] += 1
+                return result
+
+        result = index.search(query, self.score_cutoff)
+        if result is None:
+            self.stats["missed"] += 1
+            return title, 0.0
+        self.stats["global"] += 1
+        return result
+
+    def _category_index(self, category: str) -> NameIndex:
+        if category not in self.category_indexes:
+            names = self.category_achievements[category]
+            self.category_indexes[category] = NameIndex(names)
+            self.positions[category] = {name: i for i, name in reversed(list(enumerate(names)))}
+        return self.category_indexes[category]
+
+    def _predict(self, query: str, category: str, previous: str | None) -> Tuple[str, float] | None:
+        # Scores only the titles that come right after `previous`
+        self._category_index(category)
+        position = self.positions[category].get(previous)
+        if position is None:
+            return None
+        names = self.category_achievements[category][position + 1:position + 1 + self.prediction_window]
+        if len(names) == 0:
+            return None
+        result = process.extractOne(query, [default_process(name) for name in names], scorer=self.scoped_scorer,
+                                    processor=None, score_cutoff=self.prediction_cutoff)
+        if result is None:
+            return None
+        return names[result[2]], result[1]
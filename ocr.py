@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import os.path
+import shutil
+import threading
+from typing import Dict, List, Tuple
+
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:  # optional, falls back to pytesseract (one tesseract process per call)
+    tesserocr = None
+
+default_tesseract_path = "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
+logger = logging.getLogger("OCR")
+
+
+def find_tesseract() -> str | None:
+    if os.path.exists(default_tesseract_path):
+        return default_tesseract_path
+    return shutil.which("tesseract")
+
+
+class OCRProfile(object):
+    # Tesseract settings and input preparation for one kind of screen region (title, status, category)
+    single_line_psm: int = 7
+    batch_psm: int = 6  # stacked crops are a block of lines
+
+    def __init__(self, name: str, psm: int = single_line_psm, whitelist: str = None, user_words: str = None,
+                 user_patterns: str = None, target_height: int = None, threshold: int = 128):
+        self.name = name
+        self.psm = psm
+        self.whitelist = whitelist
+        self.user_words = user_words  # file paths, one word / pattern per line
+        self.user_patterns = user_patterns
+        self.target_height = target_height  # crops taller than this are downscaled to it
+        self.threshold = threshold  # binarization, None - keep grayscale
+        self.digest: str | None = None
+
+    def prepare(self, image: Image.Image) -> Image.Image:
+        if self.target_height is not None and image.height > self.target_height:
+            width = max(1, round(image.width * self.target_height / image.height))
+            image = image.resize((width, self.target_height), Image.Resampling.BOX)
+        if self.threshold is not None:
+            threshold = self.threshold
+            image = image.convert("L").point(lambda value: 255 if value >= threshold else 0)
+        return image
+
+    def init_variables(self) -> Dict[str, str]:
+        # Only read when tesseract starts
+        variables = {}
+        if self.user_words is not None:
+            variables["user_words_file"] = self.user_words
+        if self.user_patterns is not None:
+            variables["user_patterns_file"] = self.user_patterns
+        return variables
+
+    def variables(self) -> Dict[str, str]:
+        return {"tessedit_char_whitelist": self.whitelist or ""}
+
+    def fingerprint(self) -> str:
+        # Everything recognized text depends on besides the crop and the engine. Word lists are read once,
+        # they are written before the profile is used and don't change during a scan.
+        if self.digest is None:
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(f"{self.name}|{self.config()}|{self.config(batch=True)}|{self.init_variables()}".encode())
+            for path in (self.user_words, self.user_patterns):
+                if path is not None and os.path.exists(path):
+                    with open(path, 'rb') as file:
+                        digest.update(file.read())
+            self.digest = digest.hexdigest()
+        return self.digest
+
+    def config(self, batch: bool = False) -> str:
+        # pytesseract command line. It's split with shlex (posix=False on Windows) and quotes don't survive that,
+        # so word list paths and the whitelist can't contain spaces or quotes
+        config = f"--psm {self.batch_psm if batch else self.psm}"
+        if self.user_words is not None:
+            config += f" --user-words {self.user_words}"
+        if self.user_patterns is not None:
+            config += f" --user-patterns {self.user_patterns}"
+        if self.whitelist:
+            config += " -c tessedit_char_whitelist=" + "".join(c for c in self.whitelist if c not in " '\"\\")
+        return config
+
+
+class OCREngine(object):
+    name: str = "base"
+
+    def __init__(self, lang: str = 'eng'):
+        self.lang = lang
+
+    def recognize(self, image: Image.Image, profile: OCRProfile = None) -> str:
+        raise NotImplementedError
+
+    def recognize_lines(self, image: Image.Image, profile: OCRProfile = None) -> List[Tuple[str, int, int]]:
+        # (text, top, bottom) of every recognized text line
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OCREngine):
+    name = "pytesseract"
+
+    def __init__(self, lang: str = 'eng'):
+        super().__init__(lang)
+        tesseract_path = find_tesseract()
+        if tesseract_path is None:
+            raise Exception(f"Can't find tesseract at {default_tesseract_path}")
+        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+
+    def recognize(self, image: Image.Image, profile: OCRProfile = None) -> str:
+        config = profile.config() if profile is not None else ''
+        return pytesseract.image_to_string(image, lang=self.lang, config=config)
+
+    def recognize_lines(self, image: Image.Image, profile: OCRProfile = None) -> List[Tuple[str, int, int]]:
+        config = profile.config(batch=True) if profile is not None else ''
+        data = pytesseract.image_to_data(image, lang=self.lang, config=config, output_type=pytesseract.Output.DICT)
+        lines = {}
+        for i, text in enumerate(data['text']):
+            if data['level'][i] != 5 or not text.strip():  # words only
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            top, bottom = data['top'][i], data['top'][i] + data['height'][i]
+            if key in lines:
+                words, line_top, line_bottom = lines[key]
+                lines[key] = (words + [text], min(top, line_top), max(bottom, line_bottom))
+            else:
+                lines[key] = ([text], top, bottom)
+        return sorted(((" ".join(words), top, bottom) for words, top, bottom in lines.values()),
+                      key=lambda line: line[1])
+
+
+class TesserocrEngine(OCREngine):
+    # Keeps tesseract API handles (and loaded traineddata) alive for the whole scan,
+    # one per set of word lists since those are only read when tesseract starts
+    name = "tesserocr"
+
+    def __init__(self, lang: str = 'eng'):
+        super().__init__(lang)
+        if tesserocr is None:
+            raise Exception("tesserocr is not installed")
+        self.tessdata_path = None
+        tesseract_path = find_tesseract()
+        if tesseract_path is not None and os.path.isdir(os.path.join(os.path.dirname(tesseract_path), 'tessdata')):
+            self.tessdata_path = os.path.join(os.path.dirname(tesseract_path), 'tessdata')
+
+        self.lock = threading.Lock()
+        self.apis: Dict[Tuple[Tuple[str, str], ...], tesserocr.PyTessBaseAPI] = {}
+        self.api = self.create_api({})
+
+    def create_api(self, variables: Dict[str, str]):
+        key = tuple(sorted(variables.items()))
+        if key not in self.apis:
+            if self.tessdata_path is not None:
+                self.apis[key] = tesserocr.PyTessBaseAPI(path=self.tessdata_path + os.sep, lang=self.lang,
+                                                         variables=variables)
+            else:
+                self.apis[key] = tesserocr.PyTessBaseAPI(lang=self.lang, variables=variables)
+        return self.apis[key]
+
+    def set_profile(self, profile: OCRProfile | None, batch: bool = False):
+        # Picks the API for the profile's word lists and applies its per-call settings, under self.lock
+        if profile is None:
+            api = self.api
+            api.SetPageSegMode(tesserocr.PSM.AUTO)
+            api.SetVariable("tessedit_char_whitelist", "")
+            return api
+        api = self.create_api(profile.init_variables())
+        api.SetPageSegMode(profile.batch_psm if batch else profile.psm)
+        for name, value in profile.variables().items():
+            api.SetVariable(name, value)
+        return api
+
+    def recognize(self, image: Image.Image, profile: OCRProfile = None) -> str:
+        with self.lock:
+            api = self.set_profile(profile)
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+    def recognize_lines(self, image: Image.Image, profile: OCRProfile = None) -> List[Tuple[str, int, int]]:
+        lines = []
+        with self.lock:
+            api = self.set_profile(profile, batch=True)
+            api.SetImage(image)
+            api.Recognize()
+            level = tesserocr.RIL.TEXTLINE
+            for line in tesserocr.iterate_level(api.GetIterator(), level):
+                text = line.GetUTF8Text(level)
+                box = line.BoundingBox(level)
+                if text is None or box is None or not text.strip():
+                    continue
+                lines.append((text.strip(), box[1], box[3]))
+        return sorted(lines, key=lambda line: line[1])
+
+    def close(self):
+        for api in self.apis.values():
+            api.End()
+
+
+engines = {
+    TesserocrEngine.name: TesserocrEngine,
+    PytesseractEngine.name: PytesseractEngine,
+}
+_engine: OCREngine | None = None
+
+
+def create_engine(name: str = None, lang: str = 'eng') -> OCREngine:
+    if name is not None:
+        return engines[name](lang)
+
+    for engine in engines.values():
+        try:
+            return engine(lang)
+        except Exception as exc:
+            logger.debug(f"OCR engine {engine.name} is not available: {exc}")
+    raise Exception(f"Can't find tesseract at {default_tesseract_path}")
+
+
+def get_engine() -> OCREngine:
+    global _engine
+    if _engine is None:
+        _engine = create_engine()
+        logger.info(f"Using OCR engine {_engine.name}")
+    return _engine
+
+
+def stack_images(images: List[Image.Image], gap: int) -> Tuple[Image.Image, List[Tuple[int, int]]]:
+    # One tall white image with `gap` pixels between crops, plus (top, bottom) of every crop in it
+    width = max(image.width for image in images)
+    height = sum(image.height for image in images) + gap * (len(images) + 1)
+    stacked = Image.new("L", (width, height), 255)
+    rows = []
+    top = gap
+    for image in images:
+        stacked.paste(image.convert("L"), (0, top))
+        rows.append((top, top + image.height))
+        top += image.height + gap
+    return stacked, rows
+
+
+def is_blank(image: Image.Image) -> bool:
+    # Preprocessed crops are black text on white, nothing darker than white means nothing to read
+    return image.convert("L").getextrema()[0] == 255
+
+
+def recognize_batch(images: List[Image.Image], engine: OCREngine = None, gap: int = 40,
+                    profile: OCRProfile = None) -> List[str | None]:
+    # Recognizes all crops with one engine call and maps text lines back to crops by their position.
+    # None marks crops where that didn't work out (no line found, line in a gap or across crops),
+    # those should be recognized one by one.
+    engine = engine or get_engine()
+    results: List[str | None] = ["" if is_blank(image) else None for image in images]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if len(pending) == 0:
+        return results
+
+    stacked, rows = stack_images([images[i] for i in pending], gap)
+    found = {i: [] for i in pending}
+    failed = set()
+    for text, top, bottom in engine.recognize_lines(stacked, profile):
+        center = (top + bottom) / 2
+        row = next((n for n, (row_top, row_bottom) in enumerate(rows) if row_top <= center < row_bottom), None)
+        if row is None:
+            logger.debug(f"Batch OCR line '{text}' at {top}-{bottom} is outside of all crops")
+            failed.update(pending[n] for n, (row_top, row_bottom) in enumerate(rows)
+                          if row_top - gap <= center < row_bottom + gap)
+            continue
+        row_top, row_bottom = rows[row]
+        if top < row_top - gap / 2 or bottom > row_bottom + gap / 2:
+            failed.add(pending[row])  # spans into the neighbouring crop
+        found[pending[row]].append(text)
+
+    for i, lines in found.items():
+        if len(lines) > 0 and i not in failed:
+            results[i] = "\n".join(lines)
+    return results
+
+
+def set_engine(engine: OCREngine | None):
+    global _engine
+    if _engine is not None and _engine is not engine:
+        _engine.close()
+    _engine = engine
@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+import json
+import logging
+import os.path
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger("OCRCache")
+
+
+def exact_hash(image: Image.Image, context: str = "") -> str:
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode}{image.size}{context}".encode())
+    return digest.hexdigest()
+
+
+def difference_hash(image: Image.Image) -> int:
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_bands(image_hash: int, bands: int) -> List[Tuple[int, int]]:
+    # The 64 bit dHash cut into `bands` bit ranges. Hashes less than `bands` bits apart share at least one of them.
+    width = 64 // bands
+    parts = [(band, image_hash >> (band * width) & ((1 << width) - 1)) for band in range(bands - 1)]
+    return parts + [(bands - 1, image_hash >> ((bands - 1) * width))]
+
+
+class OCRCache(object):
+    # OCR text by preprocessed crop, exact hash first, then dHash within `hamming_tolerance` (0 - exact only).
+    # dHashes are only computed with a tolerance, near matches are looked up in buckets by dHash bands.
+    # Text depends on more than the crop, so entries are kept per context: engine, OCR profile and word lists.
+
+    def __init__(self, path: str = None, max_entries: int = 20000, hamming_tolerance: int = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.hamming_tolerance = hamming_tolerance
+        # exact hash (with context) - (dHash, text, context)
+        self.entries: OrderedDict[str, Tuple[int | None, str, str]] = OrderedDict()
+        self.buckets: Dict[Tuple[str, int, int], Set[str]] = {}  # (context, band, bits) - exact hashes
+        self.hits = 0
+        self.misses = 0
+        # Since the last drain(), worker processes send these back to the main process
+        self.new_entries: Dict[str, Tuple[int | None, str, str]] = {}
+        self.new_used: Dict[str, None] = {}  # keys hit or added, least recently used first
+        self.new_hits = 0
+        self.new_misses = 0
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "OCRCache":
+        cache = cls(path, **kwargs)
+        if os.path.exists(path):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as file:
+                    for key, value in json.load(file):
+                        if len(value) == 3:  # older entries have no context and can't be trusted
+                            cache.store(key, tuple(value))
+            except (OSError, ValueError) as exc:
+                logger.warning(f"Can't read OCR cache {path}, starting empty: {exc}")
+        cache.evict()
+        return cache
+
+    def save(self):
+        if self.path is None:
+            return
+        with gzip.open(self.path, 'wt', encoding='utf-8') as file:
+            json.dump(list(self.entries.items()), file, ensure_ascii=False, separators=(',', ':'))
+
+    def evict(self):
+        while len(self.entries) > self.max_entries:
+            key, value = self.entries.popitem(last=False)
+            self.unindex(key, value)
+
+    def index(self, key: str, value: Tuple[int | None, str, str]):
+        image_hash, _, context = value
+        if image_hash is None or self.hamming_tolerance <= 0:
+            return
+        for band in hash_bands(image_hash, self.hamming_tolerance + 1):
+            self.buckets.setdefault((context, *band), set()).add(key)
+
+    def unindex(self, key: str, value: Tuple[int | None, str, str]):
+        image_hash, _, context = value
+        if image_hash is None or self.hamming_tolerance <= 0:
+            return
+        for band in hash_bands(image_hash, self.hamming_tolerance + 1):
+            bucket = self.buckets.get((context, *band))
+            if bucket is not None:
+                bucket.discard(key)
+                if len(bucket) == 0:
+                    del self.buckets[(context, *band)]
+
+    def store(self, key: str, value: Tuple[int | None, str, str]):
+        if key in self.entries:
+            self.unindex(key, self.entries[key])
+        self.entries[key] = value
+        self.index(key, value)
+
+    def nearest(self, image_hash: int, context: str = "") -> str | None:
+        candidates = set()
+        for band in hash_bands(image_hash, self.hamming_tolerance + 1):
+            candidates.update(self.buckets.get((context, *band), ()))
+        distances = {key: (image_hash ^ self.entries[key][0]).bit_count() for key in candidates}
+        key = min(distances, key=distances.get, default=None)
+        return key if key is not None and distances[key] <= self.hamming_tolerance else None
+
+    def get(self, image: Image.Image, context: str = "") -> str | None:
+        key = exact_hash(image, context)
+        if key not in self.entries and self.hamming_tolerance > 0:
+            key = self.nearest(difference_hash(image), context)
+
+        if key is None or key not in self.entries:
+            self.misses += 1
+            self.new_misses += 1
+            return None
+        self.hits += 1
+        self.new_hits += 1
+        self.touch(key)
+        return self.entries[key][1]
+
+    def put(self, image: Image.Image, text: str, context: str = ""):
+        key = exact_hash(image, context)
+        self.store(key, (difference_hash(image) if self.hamming_tolerance > 0 else None, text, context))
+        self.new_entries[key] = self.entries[key]
+        self.touch(key)
+        self.evict()
+
+    def touch(self, key: str):
+        self.entries.move_to_end(key)
+        self.new_used.pop(key, None)
+        self.new_used[key] = None
+
+    def drain(self) -> dict:
+        delta = {"entries": self.new_entries, "used": list(self.new_used), "hits": self.new_hits,
+                 "misses": self.new_misses}
+        self.new_entries, self.new_used, self.new_hits, self.new_misses = {}, {}, 0, 0
+        return delta
+
+    def merge(self, delta: dict):
+        # Same recency as in the worker, so crops that hit on every scan aren't the first ones evicted
+        for key, value in delta["entries"].items():
+            self.store(key, value)
+        for key in delta["used"]:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        self.hits += delta["hits"]
+        self.misses += delta["misses"]
+        self.evict()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total > 0 else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), {len(self.entries)} entries"
+
+
+cache: OCRCache | None = None
+
+
+def get_cache() -> OCRCache | None:
+    return cache
+
+
+def set_cache(new_cache: OCRCache | None):
+    global cache
+    cache = new_cache
@@ -0,0 +1,114 @@
+import logging
+import os
+from collections import deque
+from concurrent import futures
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Tuple
+
+from PIL import Image
+
+from ocr_cache import OCRCache, get_cache, set_cache
+from recognition import recognize_page, load_database
+from tracing import Tracer, get_tracer, set_tracer, span
+
+
+def init_worker(cache_path: str | None, hamming_tolerance: int, trace: bool = False):
+    load_database()
+    if cache_path is not None:
+        set_cache(OCRCache.load(cache_path, hamming_tolerance=hamming_tolerance))
+    if trace:
+        set_tracer(Tracer())
+
+
+def recognize_traced(achievement_ids: List[int], title_images: List[Image.Image], status_images: List[Image.Image],
+                     postprocess: bool, category: str = None) -> List[Tuple[str, bool | int, float]]:
+    # recognize_page, with its spans attributed to the page's achievements
+    tracer = get_tracer()
+    if tracer is None:
+        return recognize_page(title_images, status_images, postprocess, category)
+    context = dict(tracer.context)
+    tracer.context["achievement_ids"] = achievement_ids
+    try:
+        with span("recognize_page"):
+            return recognize_page(title_images, status_images, postprocess, category)
+    finally:
+        tracer.context = context
+
+
+def process_page(achievement_ids: List[int], title_images: List[Image.Image], status_images: List[Image.Image],
+                 postprocess: bool, category: str = None):
+    # Runs in a worker, newly cached OCR results and timings go back to the main process with the results
+    results = recognize_traced(achievement_ids, title_images, status_images, postprocess, category)
+    cache = get_cache()
+    tracer = get_tracer()
+    return results, cache.drain() if cache is not None else None, tracer.drain() if tracer is not None else None
+
+
+class ScanPipeline(object):
+    # UI thread submits raw crops, worker processes preprocess/OCR/match them, results come back in submit order.
+    # workers=0 runs everything in the calling thread (same results, no parallelism).
+
+    def __init__(self, workers: int = None, max_pending: int = 10, postprocess: bool = True,
+                 cache: OCRCache = None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending  # achievements being worked on, not counting finished ones
+        self.postprocess = postprocess
+        self.cache = cache
+        self.logger = logging.getLogger("ScanPipeline")
+        self.pending: Deque[Tuple[List[int], Future]] = deque()
+        self.executor = None
+        if self.workers > 0:
+            # Workers start from the cache as it was saved on disk, the main process collects what they add
+            cache_args = (cache.path, cache.hamming_tolerance) if cache is not None else (None, 0)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                                initargs=(*cache_args, get_tracer() is not None))
+
+    def submit(self, achievement_id: int, title_image: Image.Image, status_image: Image.Image):
+        self.submit_page([achievement_id], [title_image], [status_image])
+
+    def submit_page(self, achievement_ids: List[int], title_images: List[Image.Image],
+                    status_images: List[Image.Image], category: str = None):
+        # A page is recognized by one worker, with batched OCR calls for its titles and statuses.
+        # `category` (database name) narrows down title matching to that category's achievements.
+        if self.executor is None:
+            future = Future()
+            future.set_result((recognize_traced(achievement_ids, title_images, status_images, self.postprocess,
+                                                category), None, None))
+        else:
+            while True:  # bounded, UI thread waits for workers to catch up
+                running = [(ids, future) for ids, future in self.pending if not future.done()]
+                if sum(len(ids) for ids, _ in running) < self.max_pending:
+                    break
+                self.logger.debug(f"Pipeline is full, waiting for {len(running)} pages")
+                futures.wait([future for _, future in running], return_when=futures.FIRST_COMPLETED)
+            future = self.executor.submit(process_page, achievement_ids, title_images, status_images,
+                                          self.postprocess, category)
+        self.pending.append((achievement_ids, future))
+
+    def results(self, wait: bool = False) -> Iterator[Tuple[int, str, bool | int, float]]:
+        # Yields (achievement_id, title, completed, confidence) in submit order,
+        # stops at the first unfinished one unless `wait`.
+        # A page is taken out of the pipeline as a whole, stopping halfway through it drops the rest.
+        while len(self.pending) > 0:
+            achievement_ids, future = self.pending[0]
+            if not wait and not future.done():
+                return
+            self.pending.popleft()
+            results, cache_delta, events = future.result()
+            if cache_delta is not None and self.cache is not None:
+                self.cache.merge(cache_delta)
+            if events is not None and get_tracer() is not None:
+                get_tracer().merge(events)
+            for achievement_id, (title, completed, confidence) in zip(achievement_ids, results):
+                self.logger.info(f"Found achievement {achievement_id}: {title}")
+                yield achievement_id, title, completed, confidence
+
+    def discard(self):
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+
+    def close(self):
+        self.discard()
+        if self.executor is not None:
+            self.executor.shutdown()
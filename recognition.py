@@ -0,0 +1,153 @@
+import logging
+import os.path
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageOps
+from rapidfuzz import fuzz
+from rapidfuzz.utils import default_process
+
+from database import characters, get_database, write_word_list
+from matcher import TitleMatcher
+from ocr import OCRProfile
+from status_classifier import classify_status
+from tracing import traced
+from utils import bold_color_mask, scan_image, scan_images
+
+# Everything needed to turn captured crops into (title, completed), without touching the game window,
+# so it can run in worker processes and on machines without the game.
+logger = logging.getLogger("Recognition")
+matcher: TitleMatcher | None = None
+use_profiles: bool = True  # region-specific OCR settings, see get_profiles
+# relative on purpose, pytesseract can't pass quoted paths to tesseract on Windows
+profiles_path = os.path.join('results', 'ocr_profiles')
+profiles: Dict[str, OCRProfile] | None = None
+
+
+@traced()
+def improve_achievement_text(image: Image.Image) -> Image.Image:
+    improved = ImageOps.expand(image, border=20, fill='#f0e9dc')
+    improved = bold_color_mask(improved, grayscale=True)
+    return improved
+
+
+@traced()
+def improve_achievement_status(image: Image.Image) -> Image.Image:
+    improved = bold_color_mask(image, target_color=(187, 167, 145), threshold=50, grayscale=True)
+    return improved
+
+
+@traced()
+def improve_achievement_category(image: Image.Image) -> Image.Image:
+    improved = bold_color_mask(image, target_color=(73, 83, 102), threshold=100, grayscale=True)
+    return improved
+
+
+def load_database() -> TitleMatcher:
+    global matcher
+    if matcher is None:
+        database = get_database()
+        categories = list(database.category_names.values())
+        matcher = TitleMatcher(database.achievement_names, categories, category_achievements={
+            category: database.category_achievement_names(category) for category in categories})
+    return matcher
+
+
+def get_profiles() -> Dict[str, OCRProfile]:
+    # Titles are single lines and categories one or two, both from a known list of names. Statuses are "Completed"
+    # or a counter.
+    # Crops are downscaled (text stays ~20px tall, plenty for tesseract) and binarized before OCR.
+    global profiles
+    if profiles is None:
+        database = get_database()
+        achievements, categories = database.achievement_names, list(database.category_names.values())
+        os.makedirs(profiles_path, exist_ok=True)
+        status_patterns = write_word_list(os.path.join(profiles_path, 'status_patterns.txt'),
+                                          ["\\d/\\d", "\\d/\\d\\d", "\\d\\d/\\d\\d", "\\d\\d\\d/\\d\\d\\d"])
+        profiles = {
+            "title": OCRProfile("title", whitelist=characters(achievements), target_height=112,
+                                user_words=write_word_list(os.path.join(profiles_path, 'title_words.txt'),
+                                                           achievements)),
+            "status": OCRProfile("status", whitelist="Completed0123456789/", target_height=64,
+                                 user_words=write_word_list(os.path.join(profiles_path, 'status_words.txt'),
+                                                            ["Completed"]),
+                                 user_patterns=status_patterns),
+            # block of text, long headers wrap and "Series I/II" or "(I)/(II)" end up on the second line
+            "category": OCRProfile("category", psm=6, whitelist=characters(categories), target_height=72,
+                                   user_words=write_word_list(os.path.join(profiles_path, 'category_words.txt'),
+                                                              categories)),
+        }
+    return profiles
+
+
+def get_profile(kind: str) -> OCRProfile | None:
+    return get_profiles()[kind] if use_profiles else None
+
+
+def prepare(images: List[Image.Image], profile: OCRProfile | None) -> List[Image.Image]:
+    if profile is None:
+        return images
+    return [profile.prepare(image) for image in images]
+
+
+@traced("fix_title_by_database")
+def match_title_by_database(title: str, kind: str = "achievement", category: str = None,
+                            previous: str = None) -> Tuple[str, float]:
+    # (name, confidence), confidence is 0.0 when nothing in the database is close enough
+    result, confidence = load_database().match(title, kind, category, previous)
+    logger.info(f"fix_title_by_database: {title} -> {result} ({confidence} / {kind})")
+    return result, confidence
+
+
+def fix_title_by_database(title: str, kind: str = "achievement"):
+    return match_title_by_database(title, kind)[0]
+
+
+def recognize_achievement(title_image: Image.Image, status_image: Image.Image, postprocess: bool = True,
+                          category: str = None) -> Tuple[str, bool | int, float]:
+    return recognize_page([title_image], [status_image], postprocess, category)[0]
+
+
+def recognize_page(title_images: List[Image.Image], status_images: List[Image.Image], postprocess: bool = True,
+                   category: str = None) -> List[Tuple[str, bool | int, float]]:
+    # Titles and statuses are OCR'd in one batch each, statuses the classifier is sure about skip OCR.
+    # Rows are matched top to bottom, each one is expected to come after the previous in `category`.
+    statuses = [classify_status(image) for image in status_images]
+    unclear = [i for i, status in enumerate(statuses) if status is None]
+
+    title_profile, status_profile = get_profile("title"), get_profile("status")
+    if postprocess:
+        title_images = prepare([improve_achievement_text(image) for image in title_images], title_profile)
+        status_images = prepare([improve_achievement_status(status_images[i]) for i in unclear], status_profile)
+    else:
+        status_images = [status_images[i] for i in unclear]
+    scanned_titles = scan_images(title_images, title_profile)
+    for i, scanned_status in zip(unclear, scan_images(status_images, status_profile)):
+        logger.debug(f"Status: {scanned_status}")
+        statuses[i] = fuzz.partial_ratio("Completed", scanned_status, processor=default_process) >= 90.0
+    results = []
+    previous = None
+    for title, completed in zip(scanned_titles, statuses):
+        results.append(parse_achievement(title, completed, category, previous))
+        if results[-1][2] > 0:
+            previous = results[-1][0]
+    return results
+
+
+def parse_achievement(scanned_title: str, completed: bool | int, category: str = None,
+                      previous: str = None) -> Tuple[str, bool | int, float]:
+    # Fix small fuckups
+    scanned_title = scanned_title.strip()
+    if scanned_title == '':
+        return '', False, 0.0
+    scanned_title = scanned_title.splitlines()[0].replace(
+        "”", "\"").replace("“", "\"").replace('Deja', 'Déjà')
+    scanned_title, confidence = match_title_by_database(scanned_title, category=category, previous=previous)
+    return scanned_title, completed, confidence
+
+
+def recognize_category(image: Image.Image, postprocess: bool = True) -> str:
+    profile = get_profile("category")
+    if postprocess:
+        image = prepare([improve_achievement_category(image)], profile)[0]
+    scanned_category: str = " ".join(scan_image(image, profile).split())  # wrapped headers come back as two lines
+    return fix_title_by_database(scanned_category, kind="category")
@@ -0,0 +1,72 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+from typing import Dict
+
+from ocr_cache import OCRCache, set_cache
+from pipeline import ScanPipeline
+from recognition import recognize_category
+from session import SessionArchive
+from tracing import Tracer, get_tracer, set_tracer
+
+
+def replay_session(path: str, workers: int = None, postprocess: bool = True,
+                   cache: OCRCache = None) -> Dict[str, bool]:
+    # Re-runs preprocessing, OCR and database matching over a recorded session, no game or Windows needed
+    archive = SessionArchive(path)
+    set_cache(cache)
+    # category_id - name, so titles are matched within their category like during the scan
+    categories = {category["entry"]["category_id"]: recognize_category(category["image"], postprocess)
+                  for category in archive.categories()}
+    pipeline = ScanPipeline(workers, max_pending=(os.cpu_count() or 1) * 4, postprocess=postprocess, cache=cache)
+    achievements: Dict[str, bool] = {}
+
+    def collect(wait: bool = False):
+        for _, title, completed, _ in pipeline.results(wait=wait):
+            if completed:
+                achievements[title] = completed
+
+    try:
+        for page in archive.pages():
+            pipeline.submit_page([achievement["entry"]["achievement_id"] for achievement in page],
+                                 [achievement["title"] for achievement in page],
+                                 [achievement["status"] for achievement in page],
+                                 categories.get(page[0]["entry"]["category_id"]))
+            collect()
+        collect(wait=True)
+    finally:
+        pipeline.close()
+        archive.close()
+    return achievements
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Re-process a recorded scanning session")
+    parser.add_argument("session", help="Session archive recorded by GI_AchievementParser")
+    parser.add_argument("--output", default=os.path.join('results', 'replay_achievements.json'),
+                        help="Defaults to a file of its own, results/achievements.json is the last real scan")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to one per core")
+    parser.add_argument("--no-postprocessing", action="store_true", help="OCR raw crops, skip improve_* steps")
+    parser.add_argument("--cache", help="OCR cache file to use (and update), disabled by default")
+    parser.add_argument("--trace", help="Save a Chrome trace of every stage to this file, timings next to it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger('PIL').setLevel(logging.WARNING)
+    ocr_cache = OCRCache.load(args.cache) if args.cache else None
+    if args.trace:
+        set_tracer(Tracer())
+    result = replay_session(args.session, args.workers, postprocess=not args.no_postprocessing, cache=ocr_cache)
+    if ocr_cache is not None:
+        ocr_cache.save()
+        logging.info(f"OCR cache: {ocr_cache.stats()}")
+    if get_tracer() is not None:
+        timings_path = os.path.splitext(args.trace)[0] + '_timings.json'
+        get_tracer().save(args.trace, timings_path)
+        logging.info(f"Timings saved to {timings_path}:\n{get_tracer().summary()}")
+    with open(args.output, 'w') as file:
+        json.dump(result, file, indent=4)
+    logging.info(f"Saved {len(result)} completed achievements to {args.output}")
@@ -0,0 +1,81 @@
+import logging
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Where a scrolling list is, measured from the screen instead of assumed from the wheel notches sent:
+# consecutive snapshots of the list are registered against each other by their row profiles.
+logger = logging.getLogger("ScrollTracking")
+
+
+def row_profile(image: Image.Image, bands: int = 16) -> np.ndarray:
+    # (height, bands) - mean brightness of every pixel row, split into vertical bands so rows with the same
+    # layout but different text still look different
+    pixels = np.asarray(image.convert("L"), dtype=np.float32)
+    width = pixels.shape[1] - pixels.shape[1] % bands
+    return pixels[:, :width].reshape(pixels.shape[0], bands, -1).mean(axis=2)
+
+
+def measure_scroll(previous: Image.Image, current: Image.Image, max_offset: int = None,
+                   min_overlap: float = 0.2, max_error: float = 6.0) -> Tuple[int | None, float]:
+    # How many pixels the content moved up from `previous` to `current` (0 - didn't move) and the mean absolute
+    # difference of the overlapping part. Offset is None when nothing lines up well enough.
+    a, b = row_profile(previous), row_profile(current)
+    if a.shape != b.shape:
+        return None, float("inf")
+    height = a.shape[0]
+    limit = int(height * (1 - min_overlap))
+    max_offset = limit if max_offset is None else min(max_offset, limit)
+
+    errors = np.array([np.abs(a[offset:] - b[:height - offset]).mean() for offset in range(max_offset + 1)])
+    offset = int(errors.argmin())
+    if errors[offset] > max_error:
+        logger.debug(f"No match between frames, best offset {offset} with error {errors[offset]:.1f}")
+        return None, float(errors[offset])
+    return offset, float(errors[offset])
+
+
+class ScrollTracker(object):
+    # Content position of a list in base (2560x1440) pixels. `notch` - how far one wheel notch scrolls,
+    # refined from every scroll that wasn't cut short by the end of the list.
+
+    def __init__(self, notch: float, scale: float):
+        self.notch = notch
+        self.scale = scale  # screen pixels per base pixel
+        self.position = 0.0
+        self.frame: Image.Image | None = None
+
+    def reset(self, frame: Image.Image):
+        self.position = 0.0
+        self.frame = frame
+
+    def steps_for(self, distance: float) -> int:
+        return max(1, round(distance / self.notch))
+
+    def update(self, frame: Image.Image, steps: int) -> float | None:
+        # Registers the new frame against the previous one, returns how far the list moved (base pixels)
+        expected = steps * self.notch * self.scale
+        offset, error = measure_scroll(self.frame, frame, max_offset=int(expected * 1.5) + 1)
+        self.frame = frame
+        if offset is None:
+            logger.warning(f"Lost track of the list after {steps} notches, assuming it moved as expected")
+            offset = expected
+        moved = offset / self.scale
+        if steps > 0 and 0.9 * expected <= offset <= 1.1 * expected:
+            self.notch = 0.8 * self.notch + 0.2 * moved / steps
+        self.position += moved
+        logger.debug(f"Scrolled {moved:.1f} px ({steps} notches, error {error:.1f}), at {self.position:.1f}")
+        return moved
+
+
+def visible_rows(first_top: float, pitch: float, height: float, view_top: float, view_bottom: float,
+                 position: float) -> List[Tuple[int, float]]:
+    # (row, top) of every row fully inside the view, tops in base pixels on screen
+    first = max(0, int(np.ceil((view_top - first_top + position) / pitch)))
+    rows = []
+    row = first
+    while first_top + row * pitch - position + height <= view_bottom:
+        rows.append((row, first_top + row * pitch - position))
+        row += 1
+    return rows
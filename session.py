@@ -0,0 +1,153 @@
+import json
+import logging
+import queue
+import threading
+import zipfile
+from typing import Dict, Iterator, List, Tuple
+
+from PIL import Image
+
+# Session archive: one zip with raw (pre-improve_*) crops stored as deflated pixel data and an index.json,
+# entries are kept in capture order.
+index_name = 'index.json'
+logger = logging.getLogger("SessionRecorder")
+# all - every crop, every_nth - achievements whose id is a multiple of `every`,
+# low_confidence - rows whose title matched the database with less than `min_confidence`,
+# failures - rows whose title didn't match at all. Category crops are few and always kept.
+policies = ["all", "every_nth", "low_confidence", "failures"]
+
+
+class SessionRecorder(object):
+    # Crops are compressed and written by a background thread, record() only queues them.
+    # When the queue is full or the archive reaches `max_bytes` of pixel data, crops are dropped, not waited for.
+
+    def __init__(self, path: str, metadata: dict = None, policy: str = "all", every: int = 10,
+                 min_confidence: float = 95.0, compresslevel: int = 1, max_bytes: int | None = None,
+                 max_queue: int = 256, max_held: int = 64):
+        if policy not in policies:
+            raise ValueError(f"Unknown session policy {policy}, expected one of {', '.join(policies)}")
+        self.path = path
+        # compresslevel 0 stores pixel data as is: fastest to write, biggest archive
+        compression = zipfile.ZIP_STORED if compresslevel == 0 else zipfile.ZIP_DEFLATED
+        self.archive = zipfile.ZipFile(path, 'w', compression=compression,
+                                       compresslevel=compresslevel if compresslevel > 0 else None)
+        self.metadata = dict(metadata or {}, policy=policy)
+        self.policy = policy
+        self.every = every
+        self.min_confidence = min_confidence
+        self.max_bytes = max_bytes
+        self.max_held = max_held
+        self.index: List[dict] = []
+        self.bytes_written = 0
+        self.dropped = 0
+        self.held: Dict[int, List[Tuple[Image.Image, dict]]] = {}  # achievement_id - crops waiting for resolve()
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.writer = threading.Thread(target=self.write_loop, name="SessionRecorder", daemon=True)
+        self.writer.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def record(self, image: Image.Image, kind: str, box_key: str, achievement_id: int, category_id: int):
+        entry = {
+            "kind": kind,  # title, status or category
+            "box_key": box_key,
+            "achievement_id": achievement_id,
+            "category_id": category_id,
+            "mode": image.mode,
+            "size": image.size,
+        }
+        if kind == "category" or self.policy == "all":
+            self.enqueue(image, entry)
+        elif self.policy == "every_nth":
+            if achievement_id % self.every == 0:
+                self.enqueue(image, entry)
+        else:
+            self.held.setdefault(achievement_id, []).append((image, entry))
+            while len(self.held) > self.max_held:  # rows that never got a result, e.g. discarded pages
+                self.held.pop(next(iter(self.held)))
+
+    def resolve(self, achievement_id: int, title: str, confidence: float):
+        # Recognition result of a row, low_confidence and failures policies keep its crops or let them go
+        crops = self.held.pop(achievement_id, [])
+        failed = title == '' or confidence <= 0.0
+        if failed or (self.policy == "low_confidence" and confidence < self.min_confidence):
+            for image, entry in crops:
+                entry["title"], entry["confidence"] = title, confidence
+                self.enqueue(image, entry)
+
+    def enqueue(self, image: Image.Image, entry: dict):
+        try:
+            self.queue.put_nowait((image, entry))
+        except queue.Full:
+            self.dropped += 1
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            image, entry = item
+            data = image.tobytes()
+            if self.max_bytes is not None and self.bytes_written + len(data) > self.max_bytes:
+                self.dropped += 1
+                continue
+            entry["name"] = f"{len(self.index):06d}.{image.mode}"
+            self.archive.writestr(entry["name"], data)
+            self.bytes_written += len(data)
+            self.index.append(entry)
+
+    def stats(self) -> str:
+        return (f"{len(self.index)} crops, {self.bytes_written / 2 ** 20:.1f} MB of pixel data, "
+                f"{self.dropped} dropped, {self.queue_depth} queued")
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        self.archive.writestr(index_name, json.dumps({"metadata": self.metadata, "entries": self.index}))
+        self.archive.close()
+
+
+class SessionArchive(object):
+    def __init__(self, path: str):
+        self.path = path
+        self.archive = zipfile.ZipFile(path, 'r')
+        index = json.loads(self.archive.read(index_name))
+        self.metadata: dict = index["metadata"]
+        self.entries: List[dict] = index["entries"]
+
+    def image(self, entry: dict) -> Image.Image:
+        return Image.frombytes(entry["mode"], tuple(entry["size"]), self.archive.read(entry["name"]))
+
+    def achievements(self) -> Iterator[Dict[str, Image.Image | dict]]:
+        # Title and status crops of the same achievement, in capture order
+        title = None
+        for entry in self.entries:
+            if entry["kind"] == "title":
+                title = entry
+            elif entry["kind"] == "status" and title is not None \
+                    and title["achievement_id"] == entry["achievement_id"]:
+                yield {"title": self.image(title), "status": self.image(entry), "entry": title}
+                title = None
+
+    def pages(self) -> Iterator[List[Dict[str, Image.Image | dict]]]:
+        # Achievements grouped the way they were captured, a page starts at a box key ending with _0
+        page = []
+        for achievement in self.achievements():
+            entry = achievement["entry"]
+            if len(page) > 0 and (entry["box_key"].endswith("_0")
+                                  or entry["category_id"] != page[0]["entry"]["category_id"]):
+                yield page
+                page = []
+            page.append(achievement)
+        if len(page) > 0:
+            yield page
+
+    def categories(self) -> Iterator[Dict[str, Image.Image | dict]]:
+        for entry in self.entries:
+            if entry["kind"] == "category":
+                yield {"image": self.image(entry), "entry": entry}
+
+    def close(self):
+        self.archive.close()
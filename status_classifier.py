@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import os.path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+from rapidfuzz import fuzz
+from rapidfuzz.utils import default_process
+
+from tracing import traced
+from utils import get_asset_path
+
+# Status boxes only ever show a handful of visually stable states, so instead of OCR'ing "Completed" we compare
+# the raw crop against reference features, calibrated once from a recorded session (see __main__ below).
+# Crops are resized to one size first, the same way scale_box_to_resolution scales boxes.
+logger = logging.getLogger("StatusClassifier")
+labels = ["completed", "in_progress", "step_1", "step_2", "step_3"]
+steps = 3  # step achievements give 5, 10 and 20 primogems
+feature_size = (64, 40)  # status box is 220x140 at 2560x1440
+
+
+def status_features(image: Image.Image) -> np.ndarray:
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    small = np.asarray(image.resize(feature_size, Image.Resampling.BILINEAR, reducing_gap=1.5))
+    # coarse color histogram (where the colors are) + 16x10 grayscale thumbnail (where the text is)
+    bins = (small // 64).reshape(-1, 3)
+    histogram = np.bincount(bins[:, 0] * 16 + bins[:, 1] * 4 + bins[:, 2], minlength=64) / len(bins)
+    thumbnail = small.reshape(10, 4, 16, 4, 3).mean(axis=(1, 3)) @ np.array([0.299, 0.587, 0.114]) / 255
+    return np.concatenate([histogram, thumbnail.flatten() / 10])
+
+
+def label_to_completed(label: str) -> bool | int:
+    # True when completed (for step achievements: all steps), number of finished steps before that, False otherwise
+    if label == "completed":
+        return True
+    if label.startswith("step_"):
+        finished = int(label.split("_")[1])
+        return True if finished >= steps else finished
+    return False
+
+
+def is_completed(completed: bool | int | None) -> bool:
+    # Results from before the last step counted as completed have all steps stored as a number
+    return completed is True or (type(completed) is int and completed >= steps)
+
+
+class StatusClassifier(object):
+    min_confidence: float = 0.5
+
+    def __init__(self, references: Dict[str, List[float]]):
+        self.labels = list(references.keys())
+        self.references = np.asarray([references[label] for label in self.labels])
+
+    @classmethod
+    def load(cls, path: str = None) -> "StatusClassifier | None":
+        path = path or get_asset_path()['status_references.json']
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding='utf-8') as file:
+            return cls(json.load(file)["references"])
+
+    def classify(self, image: Image.Image) -> Tuple[str | None, float]:
+        # (label, confidence), confidence is how much closer the best reference is than the runner-up
+        if len(self.labels) < 2:
+            return None, 0.0
+        distances = np.abs(self.references - status_features(image)).sum(axis=1)
+        best, second = np.argsort(distances)[:2]
+        confidence = 1.0 - distances[best] / max(distances[second], 1e-9)
+        return self.labels[best], float(confidence)
+
+
+_classifier: StatusClassifier | None = None
+_loaded = False
+
+
+def get_classifier() -> StatusClassifier | None:
+    global _classifier, _loaded
+    if not _loaded:
+        _classifier = StatusClassifier.load()
+        _loaded = True
+    return _classifier
+
+
+@traced()
+def classify_status(image: Image.Image) -> bool | int | None:
+    # label_to_completed() of the crop, None when there are no references or the classifier isn't sure
+    classifier = get_classifier()
+    if classifier is None:
+        return None
+    label, confidence = classifier.classify(image)
+    if label is None or confidence < classifier.min_confidence:
+        logger.debug(f"Status is unclear ({label}, {confidence:.2f}), falling back to OCR")
+        return None
+    return label_to_completed(label)
+
+
+def build_references(samples: List[Tuple[str, Image.Image]]) -> Dict[str, List[float]]:
+    # Averages features per label over (label, raw status crop) samples
+    features: Dict[str, List[np.ndarray]] = {}
+    for label, image in samples:
+        features.setdefault(label, []).append(status_features(image))
+    for label, label_features in features.items():
+        logger.info(f"{label}: {len(label_features)} samples")
+    return {label: np.mean(label_features, axis=0).tolist() for label, label_features in features.items()}
+
+
+def label_session(session_path: str, labels_path: str = None) -> List[Tuple[str, Image.Image]]:
+    # (label, raw status crop) of every achievement in a recorded session. Labels come from OCR of each status crop
+    # (completed / in_progress), a labels file ({achievement_id: label}) overrides them, steps need one.
+    from recognition import improve_achievement_status
+    from session import SessionArchive
+    from utils import scan_image
+
+    manual = {}
+    if labels_path is not None:
+        with open(labels_path, "r", encoding='utf-8') as file:
+            manual = {int(k): v for k, v in json.load(file).items()}
+
+    samples = []
+    archive = SessionArchive(session_path)
+    for achievement in archive.achievements():
+        achievement_id = achievement["entry"]["achievement_id"]
+        label = manual.get(achievement_id)
+        if label is None:
+            text = scan_image(improve_achievement_status(achievement["status"]))
+            completed = fuzz.partial_ratio("Completed", text, processor=default_process) >= 90.0
+            label = "completed" if completed else "in_progress"
+        samples.append((label, achievement["status"]))
+    archive.close()
+    return samples
+
+
+def calibrate(session_path: str, labels_path: str = None) -> Dict[str, List[float]]:
+    return build_references(label_session(session_path, labels_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build status box references from a recorded session")
+    parser.add_argument("session", help="Session archive recorded by GI_AchievementParser")
+    parser.add_argument("--labels", help="JSON file with {achievement_id: label}, labels: " + ", ".join(labels))
+    parser.add_argument("--output", default=os.path.join('assets', 'status_references.json'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    references = calibrate(args.session, args.labels)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({"feature_size": feature_size, "references": references}, file)
+    logging.info(f"Saved references for {', '.join(references.keys())} to {args.output}")
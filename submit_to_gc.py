@@ -1,56 +1,153 @@
+import argparse
+import asyncio
 import json
 import logging
-from time import sleep
+import os.path
+import time
 
 import httpx
 from tqdm import tqdm
 
-from utils import get_asset_path
+from database import get_database
 
+update_url = 'https://genshin-center.com/api/achievements/update'
+ledger_path = os.path.join('results', 'gc_submitted.json')
+logger = logging.getLogger("SubmitToGC")
 
-def submit_ids(ids_to_submit: list[int], cookies: str):
-    cookies_as_dict = {cookie.split('=', 1)[0]: cookie.split('=', 1)[1] for cookie in cookies.split(';')}
 
-    with httpx.Client(http2=True, cookies=cookies_as_dict) as client:
-        for id_to_submit in tqdm(ids_to_submit):
-            # print(f'Загружаем achievementId {id_to_submit}')
-            result = client.post('https://genshin-center.com/api/achievements/update',
-                                 json={'achievementId': id_to_submit, 'done': True})
-            result.raise_for_status()
-            sleep(0.1)
+class TokenBucket(object):
+    # Allows `rate` requests per second on average, with bursts of up to `burst`
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
 
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
-def main():
+
+class Ledger(object):
+    # IDs already marked as done on Genshin Center, so re-runs only send the new ones
+    def __init__(self, path: str):
+        self.path = path
+        self.submitted: set[int] = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding='utf-8') as file:
+                self.submitted = set(json.load(file))
+
+    def save(self):
+        with open(self.path, "w", encoding='utf-8') as file:
+            json.dump(sorted(self.submitted), file)
+
+
+async def submit_id(client: httpx.AsyncClient, limiter: TokenBucket, id_to_submit: int, url: str,
+                    retries: int = 5, backoff: float = 0.5):
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        try:
+            result = await client.post(url, json={'achievementId': id_to_submit, 'done': True})
+        except httpx.TransportError as exc:
+            if attempt == retries:
+                raise
+            logger.warning(f"achievementId {id_to_submit}: {exc!r}, retrying")
+            await asyncio.sleep(backoff * 2 ** attempt)
+            continue
+
+        if result.status_code == 429 or result.status_code >= 500:
+            if attempt == retries:
+                result.raise_for_status()
+            retry_after = result.headers.get('Retry-After', '')
+            delay = float(retry_after) if retry_after.isdigit() else backoff * 2 ** attempt
+            logger.warning(f"achievementId {id_to_submit}: HTTP {result.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        result.raise_for_status()
+        return
+
+
+async def submit_ids_async(ids_to_submit: list[int], cookies: dict[str, str], ledger: Ledger = None,
+                           concurrency: int = 4, rate: float = 8.0, url: str = update_url) -> list[int]:
+    # Returns IDs that couldn't be submitted
+    limiter = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = []
+    progress = tqdm(total=len(ids_to_submit))
+
+    async def worker(client: httpx.AsyncClient, id_to_submit: int):
+        async with semaphore:
+            try:
+                await submit_id(client, limiter, id_to_submit, url)
+            except httpx.HTTPError as exc:
+                logger.error(f"achievementId {id_to_submit}: {exc!r}")
+                failed.append(id_to_submit)
+            else:
+                if ledger is not None:
+                    ledger.submitted.add(id_to_submit)
+            progress.update()
+
+    async with httpx.AsyncClient(http2=True, cookies=cookies) as client:
+        await asyncio.gather(*(worker(client, id_to_submit) for id_to_submit in ids_to_submit))
+    progress.close()
+    return failed
+
+
+def submit_ids(ids_to_submit: list[int], cookies: str, ledger: Ledger = None, **kwargs) -> list[int]:
+    cookies_as_dict = {cookie.split('=', 1)[0].strip(): cookie.split('=', 1)[1] for cookie in cookies.split(';')}
+    if ledger is not None:
+        skipped = [gc_id for gc_id in ids_to_submit if gc_id in ledger.submitted]
+        if skipped:
+            print(f'Пропускаем {len(skipped)} уже загруженных достижений')
+        ids_to_submit = [gc_id for gc_id in ids_to_submit if gc_id not in ledger.submitted]
+
+    try:
+        return asyncio.run(submit_ids_async(ids_to_submit, cookies_as_dict, ledger, **kwargs))
+    finally:
+        if ledger is not None:
+            ledger.save()
+
+
+def main(ignore_ledger: bool = False):
     cookies = input('Введите свои куки из genshin-center.com и нажмите "Enter": ')
-    assets = get_asset_path()
     with open("results\\achievements.json", "r", encoding='utf-8') as file:
         completed_achievements = json.load(file)
-    with open(assets['gc_achievements.json'], "r", encoding='utf-8') as file:
-        gc_achievements = json.load(file)
-    # gc_map = {v['name']: k for k, v in gc_achievements.items()}
-    gc_map = {}
-    for k, v in gc_achievements.items():
-        ach_name = v['name']
-        if gc_map.get(ach_name):
-            gc_map[ach_name].append(int(k))
-        else:
-            gc_map[ach_name] = [int(k)]
+    database = get_database()
+    gc_map = database.ids_by_name
 
     ids_to_submit = []
-    for k in completed_achievements.keys():
+    for k, completed in completed_achievements.items():
         gc_ids = gc_map.get(k)
         if not gc_ids:
             print(f'Пропускаем {k} (нет в базе)')
             continue
-        # if gc_achievements.get(str(gc_ids[0]), {'category_id': 123})['category_id'] == 0:
+        if completed is not True:  # number of finished steps, steps go from 5 to 20 primogems
+            gc_ids = sorted(gc_ids, key=lambda gc_id: database.primo_by_id[gc_id])[:completed]
+        # if database.category_by_id.get(gc_ids[0], 123) == 0:
         ids_to_submit += gc_ids
-    submit_ids(ids_to_submit, cookies)
+
+    ledger = None if ignore_ledger else Ledger(ledger_path)
+    failed = submit_ids(ids_to_submit, cookies, ledger)
+    if failed:
+        print(f'Не удалось загрузить {len(failed)} достижений: {failed}. Запустите загрузчик ещё раз.')
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.WARN, format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ignore-ledger", action="store_true",
+                        help="Submit everything again, e.g. for another Genshin Center account")
+    args = parser.parse_args()
     try:
-        main()
+        main(ignore_ledger=args.ignore_ledger)
     except Exception as exc:
         logging.exception(exc)
     input('Нажмите "Enter" для выхода.')
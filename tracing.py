@@ -0,0 +1,145 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+# Per-stage timings of a scan. Disabled unless a Tracer is set, then span() costs a global lookup and a shared
+# no-op context manager. Spans are saved as Chrome trace events (open in chrome://tracing or ui.perfetto.dev)
+# plus count / total / p50 / p95 / max per stage and per-stage totals per achievement.
+logger = logging.getLogger("Tracing")
+
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_span = NullSpan()
+
+
+class Span(object):
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+
+class Tracer(object):
+    def __init__(self):
+        self.events: List[dict] = []
+        # merged into every span's args, e.g. the achievement the scanner is working on
+        self.context: Dict[str, object] = {}
+        self.lock = threading.Lock()
+
+    def span(self, name: str, **args) -> Span:
+        return Span(self, name, args)
+
+    def add(self, name: str, start: int, duration: int, args: dict):
+        # perf_counter is system-wide on Windows and Linux, so worker events line up with the main process
+        event = {"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000,
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": {**self.context, **args}}
+        with self.lock:
+            self.events.append(event)
+
+    def drain(self) -> List[dict]:
+        # Events recorded since the last drain, worker processes send them back to the main process this way
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def merge(self, events: List[dict]):
+        with self.lock:
+            self.events.extend(events)
+
+    def stats(self) -> Dict[str, dict]:
+        # stage - {count, total, p50, p95, max}, in milliseconds
+        durations: Dict[str, List[float]] = {}
+        with self.lock:
+            for event in self.events:
+                durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+        stats = {}
+        for name, values in sorted(durations.items()):
+            values.sort()
+            stats[name] = {"count": len(values), "total": sum(values),
+                           "p50": values[int(0.50 * (len(values) - 1))],
+                           "p95": values[int(0.95 * (len(values) - 1))], "max": values[-1]}
+        return stats
+
+    def achievement_stats(self) -> Dict[int, Dict[str, float]]:
+        # achievement_id - {stage: milliseconds}, page-wide spans (batched OCR) are split evenly between the page
+        totals: Dict[int, Dict[str, float]] = {}
+        with self.lock:
+            for event in self.events:
+                args = event["args"]
+                achievement_ids = args.get("achievement_ids") or [args.get("achievement_id")]
+                for achievement_id in achievement_ids:
+                    if achievement_id is None:
+                        continue
+                    stages = totals.setdefault(achievement_id, {})
+                    stages[event["name"]] = stages.get(event["name"], 0.0) + event["dur"] / 1000 / len(achievement_ids)
+        return totals
+
+    def save(self, trace_path: str, stats_path: str):
+        with self.lock:
+            events = list(self.events)
+        with open(trace_path, 'w', encoding='utf-8') as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        with open(stats_path, 'w', encoding='utf-8') as file:
+            json.dump({"stages": self.stats(), "achievements": self.achievement_stats()}, file, indent=4)
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<32}{'count':>8}{'total ms':>12}{'p50':>10}{'p95':>10}{'max':>10}"]
+        for name, stage in sorted(self.stats().items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"{name:<32}{stage['count']:>8}{stage['total']:>12.1f}{stage['p50']:>10.2f}"
+                         f"{stage['p95']:>10.2f}{stage['max']:>10.2f}")
+        return "\n".join(lines)
+
+
+_tracer: Tracer | None = None
+
+
+def get_tracer() -> Tracer | None:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer | None):
+    global _tracer
+    _tracer = tracer
+
+
+def span(name: str, **args) -> Span | NullSpan:
+    if _tracer is None:
+        return null_span
+    return _tracer.span(name, **args)
+
+
+def traced(name: str = None) -> Callable:
+    # Decorator, wraps every call of the function in a span
+    def decorator(function: Callable) -> Callable:
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with _tracer.span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
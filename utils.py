@@ -2,12 +2,30 @@ import io
 import os.path
 import sys
 import threading
-import timeit
 
+import numpy as np
 import psutil
-import pytesseract
-from PIL import Image, ImageChops
-from pywinauto.win32structures import RECT
+from PIL import Image
+
+from ocr import OCRProfile, get_engine, recognize_batch
+from ocr_cache import get_cache
+from tracing import traced
+
+try:
+    from pywinauto.win32structures import RECT
+except ImportError:  # pywinauto is Windows-only, offline tools (benchmarks, replays) only need the box math
+    class RECT(object):
+        def __init__(self, left=0, top=0, right=0, bottom=0):
+            self.left, self.top, self.right, self.bottom = left, top, right, bottom
+
+        def width(self):
+            return self.right - self.left
+
+        def height(self):
+            return self.bottom - self.top
+
+        def __repr__(self):
+            return f"<RECT L{self.left}, T{self.top}, R{self.right}, B{self.bottom}>"
 
 
 def find_process(name: str):
@@ -33,27 +51,21 @@ def scale_box_to_resolution(box: RECT, window_rect: RECT):
     return RECT(low_res_left, low_res_top, low_res_right, low_res_bottom)
 
 
-def bold_color_mask(image: Image.Image, target_color=(85, 85, 85), threshold=50):
-    # Create a mask for the gradient effect
-    start_mask = timeit.default_timer()
+def bold_color_mask(image: Image.Image, target_color=(85, 85, 85), threshold=50, grayscale: bool = False):
+    # Every pixel further than `threshold` from `target_color` gets painted white, the rest is kept as-is
+    pixels = np.asarray(image.convert("RGB"))
+    difference = pixels.astype(np.int32) - np.asarray(target_color, dtype=np.int32)
+    mask = np.einsum('ijk,ijk->ij', difference, difference) > threshold ** 2
 
-    mask = Image.new("L", image.size)
-    for x in range(image.width):
-        for y in range(image.height):
-            pixel = image.getpixel((x, y))
-            color_difference = sum((a - b) ** 2 for a, b in zip(pixel, target_color))
-            if color_difference <= threshold ** 2:
-                mask.putpixel((x, y), 0)
-            else:
-                mask.putpixel((x, y), 255)
+    if grayscale:
+        # grayscale(white) == 255, so converting first and masking after is the same as composite -> grayscale
+        result = np.array(image.convert("L"))
+        result[mask] = 255
+        return Image.fromarray(result)
 
-    end_mask = timeit.default_timer()
-
-    # Apply the mask to the original image
-    composited = ImageChops.composite(Image.new("RGB", image.size, (255, 255, 255)), image, mask)
-    end_composite = timeit.default_timer()
-    # print(f"Mask: {end_mask - start_mask}, Composite: {end_composite - end_mask}")
-    return composited
+    result = pixels.copy()
+    result[mask] = 255
+    return Image.fromarray(result)
 
 
 def generate_achievement_boxes(achievement: RECT, status: RECT | None, height_adjust: int,
@@ -79,25 +91,57 @@ def generate_achievement_boxes(achievement: RECT, status: RECT | None, height_ad
     return box_coords
 
 
-def scan_image(image: str | bytes) -> str:
-    data = image
-    if isinstance(image, str):
-        with open(image, 'rb') as file:
-            data = file.read()
+def cache_context(profile: OCRProfile | None) -> str:
+    # Cached text is only reused for the same engine and profile
+    return f"{get_engine().name}/{profile.fingerprint() if profile is not None else ''}"
 
-    default_tesseract_path = "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
-    if not os.path.exists(default_tesseract_path):
-        raise Exception(f"Can't find tesseract at {default_tesseract_path}")
-    else:
-        pytesseract.pytesseract.tesseract_cmd = default_tesseract_path
-        fake_file = io.BytesIO(data)
-        return pytesseract.image_to_string(Image.open(fake_file), lang='eng')
+
+@traced()
+def scan_image(image: str | bytes | Image.Image, profile: OCRProfile = None) -> str:
+    if isinstance(image, str):
+        image = Image.open(image)
+    elif isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+
+    cache = get_cache()
+    if cache is not None:
+        text = cache.get(image, cache_context(profile))
+        if text is not None:
+            return text
+
+    text = get_engine().recognize(image, profile)
+    if cache is not None:
+        cache.put(image, text, cache_context(profile))
+    return text
+
+
+@traced()
+def scan_images(images: list[Image.Image], profile: OCRProfile = None) -> list[str]:
+    # scan_image for a whole page of crops: cached ones are skipped, the rest goes through one batch OCR call,
+    # crops the batch couldn't map back are scanned one by one
+    cache = get_cache()
+    context = cache_context(profile) if cache is not None else None
+    results = [cache.get(image, context) if cache is not None else None for image in images]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) == 0:
+        return results
+
+    batch = recognize_batch([images[i] for i in missing], profile=profile) if len(missing) > 1 else [None]
+    for i, text in zip(missing, batch):
+        if text is None:
+            text = get_engine().recognize(images[i], profile)
+        if cache is not None:
+            cache.put(images[i], text, context)
+        results[i] = text
+    return results
 
 
 def get_asset_path():
     assets = {
-        'gc_achievements.json': 'assets\\gc_achievements.json',
-        'gc_categories.json': 'assets\\gc_categories.json',
+        'gc_achievements.json': os.path.join('assets', 'gc_achievements.json'),
+        'gc_categories.json': os.path.join('assets', 'gc_categories.json'),
+        'status_references.json': os.path.join('assets', 'status_references.json'),
+        'gc_database.pickle': os.path.join('assets', 'gc_database.pickle'),
     }
     if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
         return {k: os.path.join(sys._MEIPASS, v) for k, v in assets.items()}
@@ -0,0 +1,43 @@
+import logging
+import time
+from typing import Callable
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger("Waits")
+
+
+def frame_difference(first: Image.Image, second: Image.Image) -> float:
+    # Mean absolute difference of grayscale pixels, 0 - identical frames
+    if first.size != second.size:
+        return 255.0
+    a = np.asarray(first.convert("L"), dtype=np.int16)
+    b = np.asarray(second.convert("L"), dtype=np.int16)
+    return float(np.abs(a - b).mean())
+
+
+def wait_for_stable_frame(grab: Callable[[], Image.Image], timeout: float = 2.0, min_settle: float = 0.1,
+                          poll_interval: float = 0.03, stable_frames: int = 2, threshold: float = 1.0,
+                          name: str = "frame", clock: Callable[[], float] = time.monotonic,
+                          sleep: Callable[[float], None] = time.sleep) -> float:
+    # Polls `grab` until `stable_frames` consecutive frames stop changing (and at least `min_settle` has passed),
+    # returns how long it took. Gives up after `timeout`.
+    start = clock()
+    previous = grab()
+    stable = 0
+    while True:
+        sleep(poll_interval)
+        current = grab()
+        elapsed = clock() - start
+        if frame_difference(previous, current) <= threshold:
+            stable += 1
+        else:
+            stable = 0
+        previous = current
+
+        if stable >= stable_frames and elapsed >= min_settle:
+            return elapsed
+        if elapsed >= timeout:
+            logger.debug(f"{name} did not settle in {timeout:.1f}s")
+            return elapsed